@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Pytest configuration for the benchmarks.
+
+The benchmarks run the CLI commands against a full InvenioRDM application,
+with a database that is seeded with synthetic records, drafts and files via
+bulk inserts, and with a stub indexer instead of the search cluster.
+
+They are not part of the regular test suite, and have to be run explicitly::
+
+    pip install -e .[benchmarks]
+    pytest benchmarks --benchmark-autosave
+    pytest benchmarks --benchmark-compare
+
+The number of records per scale can be set via the environment variable
+``TUW_BENCHMARK_SCALES`` (default: ``1000``, e.g. ``1000,10000,100000``).
+Since some of the queries rely on PostgreSQL features, the database should be
+set via ``SQLALCHEMY_DATABASE_URI`` accordingly.
+"""
+
+import os
+
+import pytest
+from invenio_access.models import ActionUsers
+from invenio_access.permissions import superuser_access
+from invenio_accounts import current_accounts
+from invenio_files_rest.models import Bucket, FileInstance, Location, ObjectVersion
+from invenio_pidstore.models import PersistentIdentifier
+from invenio_rdm_records.services.config import RDMRecordServiceConfig
+from invenio_rdm_records.services.permissions import RDMRecordPermissionPolicy
+from invenio_records_permissions.generators import SystemProcess
+
+from invenio_utilities_tuw.cli.seed import RepositorySeeder
+from invenio_utilities_tuw.utils import get_record_service
+
+SCALES = [
+    int(scale) for scale in os.environ.get("TUW_BENCHMARK_SCALES", "1000").split(",")
+]
+"""The numbers of records to seed the database with."""
+
+
+class StubIndexer(object):
+    """Indexer that only counts the records instead of indexing them."""
+
+    def __init__(self, record_cls):
+        """Constructor."""
+        self.record_cls = record_cls
+        self.num_indexed = 0
+        self.num_deleted = 0
+        self._queue = []
+
+    def index(self, record, *args, **kwargs):
+        """Count the record as indexed."""
+        self.num_indexed += 1
+
+    def delete(self, record, *args, **kwargs):
+        """Count the record as deleted from the index."""
+        self.num_deleted += 1
+
+    def bulk_index(self, record_ids):
+        """Queue the records for indexing."""
+        self._queue.extend(record_ids)
+
+    def process_bulk_queue(self, *args, **kwargs):
+        """Count the queued records as indexed."""
+        self.num_indexed += len(self._queue)
+        self._queue = []
+
+
+class PermissionPolicy(RDMRecordPermissionPolicy):
+    """Permission policy that lets admins delete records, like in production."""
+
+    can_delete = [SystemProcess()]
+
+
+class RecordServiceConfig(RDMRecordServiceConfig):
+    """Record service config with the above permission policy."""
+
+    permission_policy_cls = PermissionPolicy
+
+
+@pytest.fixture(scope="module")
+def celery_config():
+    """Override pytest-invenio fixture."""
+    return {}
+
+
+@pytest.fixture(scope="module")
+def app_config(app_config):
+    """Override pytest-invenio fixture, to let admins delete records and files."""
+    app_config["RDM_RECORDS_BIBLIOGRAPHIC_SERVICE_CONFIG"] = RecordServiceConfig
+    return app_config
+
+
+@pytest.fixture(scope="module")
+def create_app(instance_path):
+    """Create the full InvenioRDM (API) application."""
+    from invenio_app.factory import create_api
+
+    return create_api
+
+
+@pytest.fixture(scope="module")
+def location(database, tmp_path_factory):
+    """File storage location in a temporary directory."""
+    loc = Location(
+        name="benchmarks", uri=str(tmp_path_factory.mktemp("storage")), default=True
+    )
+    database.session.add(loc)
+    database.session.commit()
+    return loc
+
+
+@pytest.fixture(scope="module")
+def admin(database):
+    """User with superuser access, who owns the synthetic records."""
+    user = current_accounts.datastore.create_user(
+        email="admin@example.org", password=None, active=True
+    )
+    database.session.add(ActionUsers.allow(superuser_access, user=user))
+    database.session.commit()
+    return user
+
+
+@pytest.fixture(scope="module", params=SCALES, ids=lambda n: "%d-records" % n)
+def repository(request, database, location, admin):
+    """Database seeded with synthetic records, drafts and files."""
+    service = get_record_service()
+    for model_cls in (
+        service.draft_cls.model_cls,
+        service.record_cls.model_cls,
+        PersistentIdentifier,
+        ObjectVersion,
+        FileInstance,
+        Bucket,
+    ):
+        model_cls.query.delete()
+
+    database.session.commit()
+
+    num_records = request.param
+    seeder = RepositorySeeder(location, file_size=20000, seed=42)
+    seeder.seed_records(
+        num_records,
+        max(1, num_records // 10),
+        owner_ids=[admin.id],
+        edit_ratio=0.5,
+        soft_delete_ratio=0.1,
+    )
+    seeder.seed_orphans(num_buckets=max(1, num_records // 10))
+    orphans = RepositorySeeder(
+        location, file_size=1024, size_distribution="fixed", write_files=True, seed=0
+    )
+    orphans.seed_orphans(num_files=max(1, num_records // 10))
+    return num_records
+
+
+@pytest.fixture()
+def seed_orphans(location):
+    """Function for seeding additional unreferenced files in the storage.
+
+    The seeder isn't seeded, as the files' IDs would clash with the ones
+    from previous tests otherwise.
+    The location is loaded anew each time, as the module-scoped one is
+    detached from the session by then.
+    """
+
+    def seed(num_files):
+        seeder = RepositorySeeder(
+            Location.get_default(),
+            file_size=1024,
+            size_distribution="fixed",
+            write_files=True,
+        )
+        seeder.seed_orphans(num_files=num_files)
+
+    return seed
+
+
+@pytest.fixture()
+def stub_indexer(base_app, monkeypatch):
+    """Replace the record service's indexer with a stub.
+
+    The service creates a new indexer from its config on each access, so the
+    config is replaced with one whose ``indexer_cls`` returns the stub.
+    """
+    service = get_record_service()
+    indexer = StubIndexer(service.record_cls)
+
+    def indexer_cls(*args, **kwargs):
+        return indexer
+
+    config = type(
+        service.config.__name__,
+        (service.config,),
+        {"indexer_cls": staticmethod(indexer_cls)},
+    )
+    monkeypatch.setattr(service, "config", config)
+    return indexer
+
+
+@pytest.fixture()
+def cli(base_app, admin):
+    """Invoke a ``tuw`` command as the admin, and check that it succeeded."""
+    from invenio_utilities_tuw.cli import utilities
+
+    runner = base_app.test_cli_runner(env={"INVENIO_UTILITIES_TUW_USER": admin.email})
+
+    def invoke(*args, input=None):
+        result = runner.invoke(utilities, args, input=input, catch_exceptions=False)
+        assert result.exit_code == 0, result.output
+        return result
+
+    return invoke
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Benchmarks for the hot paths of the CLI commands."""
+
+
+def test_list_records(benchmark, repository, cli):
+    """Benchmark listing all records."""
+    benchmark(cli, "records", "list")
+
+
+def test_list_drafts(benchmark, repository, cli):
+    """Benchmark listing all drafts."""
+    benchmark(cli, "drafts", "list")
+
+
+def test_reindex_records(benchmark, repository, cli, stub_indexer):
+    """Benchmark reindexing all records."""
+    benchmark(cli, "records", "reindex")
+    assert stub_indexer.num_indexed >= repository
+
+
+def test_list_orphans(benchmark, repository, cli):
+    """Benchmark listing the files in orphaned buckets."""
+    benchmark(cli, "files", "orphans", "list")
+
+
+def test_clean_orphans(benchmark, repository, cli, seed_orphans):
+    """Benchmark removing the unreferenced files."""
+
+    def setup():
+        seed_orphans(max(1, repository // 10))
+
+    benchmark.pedantic(
+        cli, args=("files", "orphans", "clean", "--yes"), setup=setup, rounds=3
+    )
+
+
+def test_remove_deleted_files(benchmark, repository, cli):
+    """Benchmark hard-deleting the soft-deleted files (once per scale)."""
+    benchmark.pedantic(cli, args=("files", "deleted", "rm", "--yes"), rounds=1)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Streaming creation of BagIt bags (RFC 8493) as tar or zip archives.
+
+The payload is written into the archive straight from the given streams, and
+the manifest checksums are computed on the fly.
+"""
+
+import io
+import shutil
+import tarfile
+import time
+import zipfile
+from datetime import date
+
+from .utils import HashingReader
+
+BAG_FORMATS = {
+    "tar": ".tar",
+    "tar.gz": ".tar.gz",
+    "zip": ".zip",
+}
+"""Supported archive formats for bags, and their file extensions."""
+
+
+def _encode_path(path):
+    """Percent-encode the characters in the path that are special in manifests."""
+    return path.replace("%", "%25").replace("\n", "%0A").replace("\r", "%0D")
+
+
+class BagWriter(object):
+    """Writer for a BagIt bag, packaged as a tar or zip archive."""
+
+    def __init__(self, path, bag_name, bag_format="tar", algorithm="sha256"):
+        """Constructor."""
+        self.bag_name = bag_name
+        self.bag_format = bag_format
+        self.algorithm = algorithm
+        self.manifest = []
+        self.payload_bytes = 0
+        if bag_format == "zip":
+            self._archive = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+        else:
+            mode = "w:gz" if bag_format == "tar.gz" else "w"
+            self._archive = tarfile.open(path, mode)
+
+    def _add(self, name, stream, size):
+        """Add the stream's content to the archive, and return its checksum."""
+        reader = HashingReader(stream, self.algorithm)
+        name = "{}/{}".format(self.bag_name, name)
+        if self.bag_format == "zip":
+            info = zipfile.ZipInfo(name, time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with self._archive.open(info, "w", force_zip64=True) as target:
+                shutil.copyfileobj(reader, target, 1024 * 1024)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = size
+            info.mtime = time.time()
+            self._archive.addfile(info, reader)
+
+        return reader.checksum.split(":", 1)[1]
+
+    def add_payload(self, name, stream, size):
+        """Add a payload file (in ``data/``) from the stream."""
+        path = "data/{}".format(name)
+        self.manifest.append((self._add(path, stream, size), _encode_path(path)))
+        self.payload_bytes += size
+
+    def add_payload_bytes(self, name, data):
+        """Add a payload file (in ``data/``) with the given content."""
+        self.add_payload(name, io.BytesIO(data), len(data))
+
+    def close(self, bag_info=None):
+        """Write the tag files, and close the archive."""
+        info = {
+            "Bagging-Date": date.today().isoformat(),
+            "Payload-Oxum": "{}.{}".format(self.payload_bytes, len(self.manifest)),
+        }
+        info.update(bag_info or {})
+
+        tag_files = [
+            ("bagit.txt", "BagIt-Version: 1.0\nTag-File-Character-Encoding: UTF-8\n"),
+            ("bag-info.txt", "".join("{}: {}\n".format(*i) for i in info.items())),
+            (
+                "manifest-{}.txt".format(self.algorithm),
+                "".join("{}  {}\n".format(*entry) for entry in self.manifest),
+            ),
+        ]
+        tag_manifest = []
+        for name, content in tag_files:
+            data = content.encode("utf-8")
+            tag_manifest.append((self._add(name, io.BytesIO(data), len(data)), name))
+
+        data = "".join("{}  {}\n".format(*entry) for entry in tag_manifest)
+        data = data.encode("utf-8")
+        name = "tagmanifest-{}.txt".format(self.algorithm)
+        self._add(name, io.BytesIO(data), len(data))
+        self._archive.close()
+
+    def abort(self):
+        """Close the archive without finishing the bag."""
+        self._archive.close()
@@ -8,21 +8,176 @@
 
 """CLI commands for Invenio-Utilities-TUW."""
 
+from functools import partial
+
 import click
+from werkzeug.utils import import_string
+
+from .metrics import export_metrics, start_metrics
+from .profiling import PROFILERS, CommandProfiler
+
+COMMAND_PATH_KEY = "invenio_utilities_tuw.command_path"
+"""Key for the path of the invoked (sub-)command in the click context's meta."""
+
+
+class LazyGroup(click.Group):
+    """Command group that imports its sub-commands only when they are needed.
+
+    The lazy sub-commands are given as a mapping of their names to the import
+    path of the command and its short help, which is shown in the group's help
+    without having to import the command.
+    """
+
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        """Constructor."""
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx):
+        """List the names of the loaded and lazy sub-commands."""
+        names = set(super().list_commands(ctx)) | set(self.lazy_commands)
+        return sorted(names)
+
+    def get_command(self, ctx, name):
+        """Get the sub-command with the given name, importing it if necessary."""
+        if name not in self.commands and name in self.lazy_commands:
+            import_path, _ = self.lazy_commands[name]
+            self.add_command(import_string(import_path), name)
+
+        return super().get_command(ctx, name)
 
-from .drafts import drafts
-from .files import files
-from .records import records
-from .users import users
+    def resolve_command(self, ctx, args):
+        """Resolve the sub-command, and remember the path of the invoked command.
 
+        The path is stored in the context's ``meta`` (under ``COMMAND_PATH_KEY``)
+        before the group's callback runs, since newer versions of click clear
+        the context's remaining arguments by then.
+        """
+        ctx.meta[COMMAND_PATH_KEY] = _resolve_command_path(ctx, self, args)
+        return super().resolve_command(ctx, args)
 
-@click.group()
-def utilities():
+    def format_commands(self, ctx, formatter):
+        """Write the sub-commands' short help, without importing lazy ones."""
+        names = self.list_commands(ctx)
+        if not names:
+            return
+
+        limit = formatter.width - 6 - max(len(name) for name in names)
+        rows = []
+        for name in names:
+            command = self.commands.get(name)
+            if command is None:
+                rows.append((name, self.lazy_commands[name][1]))
+            elif not command.hidden:
+                rows.append((name, command.get_short_help_str(limit)))
+
+        if rows:
+            with formatter.section("Commands"):
+                formatter.write_dl(rows)
+
+
+def _resolve_command_path(ctx, group, args):
+    """Get the names of the (sub-)commands that will be invoked via the args."""
+    names = []
+    command = group
+    for arg in args:
+        if not isinstance(command, click.Group):
+            break
+
+        command = command.get_command(ctx, arg)
+        if command is None:
+            break
+
+        names.append(arg)
+
+    return " ".join(names)
+
+
+@click.group(
+    cls=LazyGroup,
+    lazy_commands={
+        "dev": (
+            "invenio_utilities_tuw.cli.dev:dev",
+            "Commands for development and load testing.",
+        ),
+        "drafts": (
+            "invenio_utilities_tuw.cli.drafts:drafts",
+            "Utility commands for creation and publication of drafts.",
+        ),
+        "files": (
+            "invenio_utilities_tuw.cli.files:files",
+            "Utility commands for management of files.",
+        ),
+        "records": (
+            "invenio_utilities_tuw.cli.records:records",
+            "Utility commands for creation and publication of drafts.",
+        ),
+        "users": (
+            "invenio_utilities_tuw.cli.users:users",
+            "Management commands for users.",
+        ),
+        "serve-cli": (
+            "invenio_utilities_tuw.cli.daemon:serve_cli",
+            "Run the commands sent by 'tuw-client' in a warm application.",
+        ),
+    },
+)
+@click.option(
+    "--metrics-json",
+    "metrics_json",
+    metavar="PATH",
+    default=None,
+    help="write a JSON summary of the command's performance metrics ('-': stderr)",
+)
+@click.option(
+    "--metrics-textfile",
+    "metrics_textfile",
+    metavar="PATH",
+    default=None,
+    help="write the performance metrics for the Prometheus textfile collector",
+)
+@click.option(
+    "--sql-stats",
+    "sql_stats",
+    default=False,
+    is_flag=True,
+    help="count and time the SQL statements, and report repeated patterns on exit",
+)
+@click.option(
+    "--profile",
+    "profiler",
+    type=click.Choice(PROFILERS),
+    default=None,
+    help="profile the command's run time or memory allocations",
+)
+@click.option(
+    "--profile-output",
+    "profile_output",
+    metavar="PATH",
+    default=None,
+    help=(
+        "file for the profiling results "
+        "(default: 'tuw-profile.pstats' or 'tuw-profile.txt')"
+    ),
+)
+@click.pass_context
+def utilities(ctx, metrics_json, metrics_textfile, sql_stats, profiler, profile_output):
     """Utility commands for InvenioRDM."""
-    pass
+    metrics = start_metrics(ctx.meta.get(COMMAND_PATH_KEY, ""))
+    if metrics_json or metrics_textfile:
+        ctx.call_on_close(
+            partial(export_metrics, metrics, metrics_json, metrics_textfile)
+        )
+
+    if sql_stats:
+        from .sqlstats import SQLStats
 
+        stats = SQLStats()
+        stats.install()
+        ctx.call_on_close(stats.report)
+        ctx.call_on_close(stats.uninstall)
 
-utilities.add_command(drafts)
-utilities.add_command(files)
-utilities.add_command(records)
-utilities.add_command(users)
+    if profiler:
+        command_profiler = CommandProfiler(profiler, profile_output)
+        command_profiler.start()
+        ctx.call_on_close(command_profiler.stop)
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Daemon for running the CLI commands in a warm application.
+
+The daemon loads the application (with its extensions, database pool and
+services) once, and runs the commands sent by ``tuw-client`` one after the
+other, in the working directory and with the ``INVENIO_UTILITIES_TUW_*``
+environment variables of the client.
+"""
+
+import io
+import json
+import os
+import socket
+import sys
+import threading
+import traceback
+
+import click
+from flask.cli import ScriptInfo, with_appcontext
+from invenio_db import db
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from ..client import ENV_PREFIX, FRAME_HEADER, SOCKET_ENVVAR, get_default_socket_path
+from ..utils import get_draft_file_service, get_record_file_service, get_record_service
+from .cli import utilities
+
+
+class FrameWriter(io.RawIOBase):
+    """Binary stream that sends the written data as frames over the socket.
+
+    If the client has gone away, the data is discarded.
+    """
+
+    def __init__(self, conn, kind, lock):
+        """Constructor."""
+        super().__init__()
+        self.conn = conn
+        self.kind = kind
+        self.lock = lock
+        self.broken = False
+
+    def writable(self):
+        """The stream is writable."""
+        return True
+
+    def write(self, data):
+        """Send the data as a frame."""
+        data = bytes(data)
+        if data and not self.broken:
+            try:
+                with self.lock:
+                    header = FRAME_HEADER.pack(self.kind, len(data))
+                    self.conn.sendall(header + data)
+            except OSError:
+                self.broken = True
+
+        return len(data)
+
+
+def _text_stream(conn, kind, lock):
+    """Get a text stream that sends the written text over the socket."""
+    return io.TextIOWrapper(
+        FrameWriter(conn, kind, lock),
+        encoding="utf-8",
+        line_buffering=True,
+        write_through=True,
+    )
+
+
+def _check_database():
+    """Make sure that the pooled database connections still work.
+
+    The daemon keeps its connections for a long time, during which the
+    database may have been restarted or may have closed idle connections.
+    SQLAlchemy invalidates the pool when it detects such a disconnect, so the
+    second attempt uses a fresh connection.
+    """
+    try:
+        db.session.execute(text("SELECT 1"))
+    except DBAPIError as error:
+        db.session.rollback()
+        if not error.connection_invalidated:
+            raise
+
+        db.session.execute(text("SELECT 1"))
+
+    db.session.rollback()
+
+
+def run_command(script_info, argv, cwd=None, env=None, color=None):
+    """Run the command given via argv in the warm application.
+
+    Each command runs in a fresh application context, and its database
+    session is discarded afterwards, even if the command failed.
+    The command's output is written to the current ``sys.stdout`` and
+    ``sys.stderr``, and there is no input.
+    Returns the command's exit code.
+    """
+    saved_cwd = os.getcwd()
+    saved_env = {k: v for k, v in os.environ.items() if k.startswith(ENV_PREFIX)}
+    saved_stdin = sys.stdin
+    for name in saved_env:
+        del os.environ[name]
+
+    os.environ.update(
+        {k: v for k, v in (env or {}).items() if k.startswith(ENV_PREFIX)}
+    )
+    sys.stdin = io.StringIO()
+    app_context = script_info.load_app().app_context()
+    app_context.push()
+    try:
+        if cwd:
+            os.chdir(cwd)
+
+        _check_database()
+        utilities.main(args=argv, prog_name="tuw", obj=script_info, color=color)
+        return 0
+
+    except SystemExit as error:
+        if error.code is None:
+            return 0
+
+        return error.code if isinstance(error.code, int) else 1
+
+    except Exception:
+        traceback.print_exc()
+        return 1
+
+    finally:
+        try:
+            db.session.rollback()
+        except Exception:
+            traceback.print_exc()
+
+        db.session.remove()
+        app_context.pop()
+        sys.stdin = saved_stdin
+        os.chdir(saved_cwd)
+        for name in [k for k in os.environ if k.startswith(ENV_PREFIX)]:
+            del os.environ[name]
+
+        os.environ.update(saved_env)
+
+
+def handle_connection(conn, script_info):
+    """Run the command requested via the connection, and stream its output."""
+    with conn.makefile("rb") as requests:
+        line = requests.readline()
+
+    try:
+        request = json.loads(line.decode("utf-8"))
+        argv = list(request["argv"])
+    except (ValueError, KeyError, TypeError):
+        return
+
+    lock = threading.Lock()
+    stdout, stderr = _text_stream(conn, b"o", lock), _text_stream(conn, b"e", lock)
+    saved_stdout, saved_stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = stdout, stderr
+    try:
+        if argv[:1] == ["serve-cli"]:
+            click.secho("cannot run the daemon via the daemon", fg="red", err=True)
+            exit_code = 1
+        else:
+            exit_code = run_command(
+                script_info,
+                argv,
+                cwd=request.get("cwd"),
+                env=request.get("env"),
+                color=request.get("color"),
+            )
+
+    finally:
+        sys.stdout, sys.stderr = saved_stdout, saved_stderr
+
+    try:
+        payload = str(exit_code).encode("utf-8")
+        conn.sendall(FRAME_HEADER.pack(b"x", len(payload)) + payload)
+    except OSError:
+        pass
+
+
+def _bind_socket(socket_path):
+    """Bind a Unix socket that is only accessible for the current user."""
+    if os.path.exists(socket_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+        except OSError:
+            os.remove(socket_path)
+        else:
+            probe.close()
+            raise click.UsageError("daemon already running at: %s" % socket_path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o177)
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(umask)
+
+    server.listen(16)
+    return server
+
+
+@click.command("serve-cli")
+@click.option(
+    "--socket",
+    "-s",
+    "socket_path",
+    metavar="PATH",
+    default=None,
+    envvar=SOCKET_ENVVAR,
+    help=(
+        "path of the Unix socket to listen on; can also be specified via the "
+        "environment variable %s (default: in $XDG_RUNTIME_DIR)" % SOCKET_ENVVAR
+    ),
+)
+@with_appcontext
+def serve_cli(socket_path):
+    """Run the commands sent by 'tuw-client' in a warm application.
+
+    The application is loaded once, and the commands are run one at a time.
+    Since the commands can't read any input, confirmations have to be given
+    via their options (e.g. '--yes').
+    """
+    ctx = click.get_current_context()
+    script_info = ctx.ensure_object(ScriptInfo)
+
+    # import all commands and initialize the services before the first request
+    for name in utilities.list_commands(ctx):
+        utilities.get_command(ctx, name)
+
+    get_record_service()
+    get_record_file_service()
+    get_draft_file_service()
+
+    socket_path = socket_path or get_default_socket_path()
+    server = _bind_socket(socket_path)
+    click.secho("listening on: %s" % socket_path, fg="green", err=True)
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                handle_connection(conn, script_info)
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        server.close()
+        os.remove(socket_path)
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Commands for development and load testing."""
+
+import sys
+
+import click
+from flask.cli import with_appcontext
+from invenio_files_rest.models import Location
+
+from .options import option_owners
+from .seed import BATCH_SIZE, SIZE_DISTRIBUTIONS, RepositorySeeder
+from .utils import get_identity_for_user
+
+
+@click.group()
+def dev():
+    """Commands for development and load testing."""
+    pass
+
+
+@dev.command("seed")
+@click.confirmation_option(
+    prompt="are you sure you want to fill the database with synthetic data?"
+)
+@click.option(
+    "--users",
+    "num_users",
+    metavar="N",
+    type=click.IntRange(min=0),
+    default=10,
+    show_default=True,
+    help="number of users to create as owners of the records",
+)
+@click.option(
+    "--records",
+    "-n",
+    "num_records",
+    metavar="N",
+    type=click.IntRange(min=0),
+    default=1000,
+    show_default=True,
+    help="number of published records to create",
+)
+@click.option(
+    "--drafts",
+    "num_drafts",
+    metavar="N",
+    type=click.IntRange(min=0),
+    default=100,
+    show_default=True,
+    help="number of new (unpublished) drafts to create",
+)
+@click.option(
+    "--edit-ratio",
+    "edit_ratio",
+    type=click.FloatRange(min=0, max=1),
+    default=0.1,
+    show_default=True,
+    help="share of the published records that have a draft as well",
+)
+@click.option(
+    "--soft-delete-ratio",
+    "soft_delete_ratio",
+    type=click.FloatRange(min=0, max=1),
+    default=0.1,
+    show_default=True,
+    help="share of the buckets that contain a soft-deleted file",
+)
+@click.option(
+    "--orphan-buckets",
+    "num_orphan_buckets",
+    metavar="N",
+    type=click.IntRange(min=0),
+    default=0,
+    show_default=True,
+    help="number of buckets to create without record",
+)
+@click.option(
+    "--orphan-files",
+    "num_orphan_files",
+    metavar="N",
+    type=click.IntRange(min=0),
+    default=0,
+    show_default=True,
+    help="number of files to create without object version",
+)
+@click.option(
+    "--max-files",
+    "max_files",
+    metavar="N",
+    type=click.IntRange(min=0),
+    default=3,
+    show_default=True,
+    help="maximum number of files per record or draft",
+)
+@click.option(
+    "--file-size",
+    "file_size",
+    metavar="BYTES",
+    type=click.IntRange(min=0),
+    default=100000,
+    show_default=True,
+    help="file size (exact for 'fixed', mean for 'uniform', median for 'lognormal')",
+)
+@click.option(
+    "--size-distribution",
+    "size_distribution",
+    type=click.Choice(SIZE_DISTRIBUTIONS),
+    default="lognormal",
+    show_default=True,
+    help="distribution of the file sizes",
+)
+@click.option(
+    "--write-files",
+    "write_files",
+    default=False,
+    is_flag=True,
+    help="create (sparse) files in the storage location as well",
+)
+@click.option(
+    "--location",
+    "-l",
+    "location_name",
+    metavar="NAME",
+    default=None,
+    help="name of the storage location for the files (default: default location)",
+)
+@click.option(
+    "--batch-size",
+    "batch_size",
+    metavar="N",
+    type=click.IntRange(min=1),
+    default=BATCH_SIZE,
+    show_default=True,
+    help="number of records per bulk insert",
+)
+@click.option(
+    "--seed",
+    "seed",
+    metavar="N",
+    type=int,
+    default=None,
+    help=(
+        "seed for the random number generator, for reproducible data; "
+        "each seed can only be used once per database"
+    ),
+)
+@option_owners
+@with_appcontext
+def seed(
+    num_users,
+    num_records,
+    num_drafts,
+    edit_ratio,
+    soft_delete_ratio,
+    num_orphan_buckets,
+    num_orphan_files,
+    max_files,
+    file_size,
+    size_distribution,
+    write_files,
+    location_name,
+    batch_size,
+    seed,
+    owners,
+):
+    """Fill the database with synthetic users, records, drafts and files.
+
+    The rows are created via bulk inserts rather than the services, so the
+    records have to be indexed afterwards (e.g. via "records reindex").
+    The records are owned by the created users, and the specified owners.
+    """
+    if location_name:
+        location = Location.get_by_name(location_name)
+    else:
+        location = Location.get_default()
+
+    if location is None:
+        click.secho("storage location not found", fg="red", err=True)
+        sys.exit(1)
+
+    seeder = RepositorySeeder(
+        location,
+        file_size=file_size,
+        size_distribution=size_distribution,
+        max_files=max_files,
+        write_files=write_files,
+        batch_size=batch_size,
+        seed=seed,
+    )
+
+    try:
+        owner_ids = [get_identity_for_user(owner).id for owner in owners]
+    except LookupError as error:
+        click.secho(str(error), fg="red", err=True)
+        sys.exit(1)
+
+    owner_ids.extend(seeder.seed_users(num_users))
+
+    total = num_records + num_drafts
+    num_seeded = 0
+
+    def progress(num_batch):
+        nonlocal num_seeded
+        num_seeded += num_batch
+        click.secho("seeded {}/{} records".format(num_seeded, total), err=True)
+
+    seeder.seed_records(
+        num_records,
+        num_drafts,
+        owner_ids=owner_ids,
+        edit_ratio=edit_ratio,
+        soft_delete_ratio=soft_delete_ratio,
+        progress=progress,
+    )
+    seeder.seed_orphans(num_orphan_buckets, num_orphan_files)
+
+    for table, count in sorted(seeder.counts.items()):
+        click.secho("{}: {} rows".format(table, count), fg="green")
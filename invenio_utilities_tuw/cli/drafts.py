@@ -15,26 +15,34 @@ from os.path import basename, isdir, isfile, join
 
 import click
 from flask.cli import with_appcontext
+from flask_principal import PermissionDenied
+from invenio_db import db
 from invenio_files_rest.models import ObjectVersion
 
 from ..utils import get_draft_file_service, get_record_service
 from .options import (
     option_as_user,
+    option_chunk_size,
+    option_jobs,
+    option_link_files,
     option_owners,
     option_pid_type,
     option_pid_value,
     option_pretty_print,
     option_vanity_pid,
 )
+from .queries import stream_query
 from .utils import (
     convert_to_recid,
     create_record_from_metadata,
+    deposit_files,
     get_identity_for_user,
     patch_metadata,
     read_metadata,
     set_creatibutor_names,
     set_record_owners,
 )
+from .workers import WorkerPool
 
 
 @click.group()
@@ -45,25 +53,35 @@ def drafts():
 
 @drafts.command("list")
 @option_as_user
+@option_chunk_size
+@option_jobs
 @with_appcontext
-def list_drafts(user):
+def list_drafts(user, chunk_size, jobs):
     """List all drafts accessible to the given user."""
     identity = get_identity_for_user(user)
     service = get_record_service()
-    recids = [
-        dm.json["id"]
-        for dm in service.draft_cls.model_cls.query.all()
-        if dm is not None and dm.json is not None
-    ]
 
-    for recid in recids:
+    def read(recid):
+        # dump the draft while its worker's database session is still active
         try:
-            draft = service.read_draft(id_=recid, identity=identity)
-            click.secho(
-                "{} - {}".format(draft.id, draft.data["metadata"]["title"]), fg="green"
-            )
-        except:
-            pass
+            return service.read_draft(id_=recid, identity=identity).data
+        except PermissionDenied:
+            return None
+
+    model_cls = service.draft_cls.model_cls
+    rows = db.session.query(model_cls.json["id"]).filter(model_cls.json.isnot(None))
+    recids = (recid for (recid,) in stream_query(rows, chunk_size) if recid)
+    pool = WorkerPool(jobs)
+    for recid, draft, error in pool.map(read, recids):
+        if error is not None:
+            msg = "cannot read draft {}: {}".format(recid, error)
+            click.secho(msg, fg="red", err=True)
+        elif draft is not None:
+            title = draft["metadata"]["title"]
+            click.secho("{} - {}".format(draft["id"], title), fg="green")
+
+    if pool.summary.num_errors > 0:
+        sys.exit(1)
 
 
 @drafts.command("create")
@@ -78,8 +96,9 @@ def list_drafts(user):
 )
 @option_owners
 @option_vanity_pid
+@option_link_files
 @with_appcontext
-def create_draft(metadata_path, publish, user, owners, vanity_pid):
+def create_draft(metadata_path, publish, user, owners, vanity_pid, link):
     """Create a new record draft with the specified metadata.
 
     The specified metadata path can either point to a JSON file containing the metadata,
@@ -128,18 +147,8 @@ def create_draft(metadata_path, publish, user, owners, vanity_pid):
                 msg = "ignored in '{}': {}".format(deposit_files_path, ignored)
                 click.secho(msg, fg="red", err=True)
 
-        service = get_draft_file_service()
-        service.init_files(
-            id_=recid, identity=identity, data=[{"key": fn} for fn in file_names]
-        )
-        for fn in file_names:
-            file_path = join(deposit_files_path, fn)
-            with open(file_path, "rb") as deposit_file:
-                service.set_file_content(
-                    id_=recid, file_key=fn, identity=identity, stream=deposit_file
-                )
-
-            service.commit_file(id_=recid, file_key=fn, identity=identity)
+        paths = [join(deposit_files_path, fn) for fn in file_names]
+        deposit_files(recid, identity, paths, link=link)
 
     else:
         raise Exception("neither a file nor a directory: %s" % metadata_path)
@@ -243,12 +252,12 @@ def files():
 @option_pid_value
 @option_pid_type
 @option_as_user
+@option_link_files
 @with_appcontext
-def add_files(filepaths, pid, pid_type, user):
+def add_files(filepaths, pid, pid_type, user, link):
     """Add the specified files to the draft."""
     recid = convert_to_recid(pid, pid_type)
     identity = get_identity_for_user(user)
-    service = get_draft_file_service()
 
     paths = []
     for file_path in filepaths:
@@ -274,17 +283,7 @@ def add_files(filepaths, pid, pid_type, user):
         click.secho("aborting: duplicates in file names detected", fg="red", err=True)
         sys.exit(1)
 
-    service.init_files(
-        id_=recid, identity=identity, data=[{"key": basename(fp)} for fp in paths]
-    )
-    for fp in paths:
-        fn = basename(fp)
-        with open(fp, "rb") as deposit_file:
-            service.set_file_content(
-                id_=recid, file_key=fn, identity=identity, stream=deposit_file
-            )
-        service.commit_file(id_=recid, file_key=fn, identity=identity)
-
+    deposit_files(recid, identity, paths, link=link)
     click.secho(recid, fg="green")
 
 
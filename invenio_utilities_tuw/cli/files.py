@@ -8,16 +8,66 @@
 
 """Management commands for files."""
 
+import sys
+import time
 from collections import defaultdict
+from itertools import groupby
+from os.path import isdir
+from types import SimpleNamespace
 
 import click
+from flask import current_app
 from flask.cli import with_appcontext
+from invenio_accounts.models import User
 from invenio_db import db
-from invenio_files_rest.models import Bucket, FileInstance, ObjectVersion
+from invenio_files_rest import current_files_rest
+from invenio_files_rest.models import Bucket, FileInstance, Location, ObjectVersion
 
 from ..utils import get_record_service
-from .options import option_as_user, option_pid_type, option_pid_value
-from .utils import convert_to_recid, get_identity_for_user
+from .metrics import get_metrics
+from .options import (
+    option_as_user,
+    option_chunk_size,
+    option_dry_run,
+    option_jobs,
+    option_limit,
+    option_max_bytes_rate,
+    option_max_latency,
+    option_max_rate,
+    option_optional_pid_value,
+    option_pid_type,
+    option_shard,
+    option_yes,
+)
+from .queries import (
+    bucket_size_drift_query,
+    bucket_size_query,
+    duplicate_contents_query,
+    duplicate_files_query,
+    file_uris_query,
+    iter_chunks,
+    orphaned_files_query,
+    record_buckets_query,
+    shard_filter,
+    stream_query,
+    unreferenced_files_query,
+)
+from .throttle import Throttle
+from .utils import (
+    convert_to_recid,
+    copy_file_contents,
+    get_identity_for_user,
+    get_local_path,
+    get_usage_cache_path,
+    in_shard,
+    load_usage_cache,
+    refresh_usage_cache,
+    remove_from_storage,
+    save_usage_cache,
+    touch_buckets,
+    walk_files_sorted,
+)
+from .workers import WorkerPool
 
 
 @click.group()
@@ -34,7 +84,7 @@ def deleted():
 
 @deleted.command("list")
 @option_as_user
-@option_pid_value
+@option_optional_pid_value
 @option_pid_type
 @with_appcontext
 def list_deleted_files(user, pid, pid_type):
@@ -76,10 +126,13 @@ def list_deleted_files(user, pid, pid_type):
     prompt="are you sure you want to permanently remove soft-deleted files?"
 )
 @option_as_user
-@option_pid_value
+@option_optional_pid_value
 @option_pid_type
+@option_jobs
+@option_max_rate
+@option_max_latency
 @with_appcontext
-def hard_delete_files(user, pid, pid_type):
+def hard_delete_files(user, pid, pid_type, jobs, max_rate, max_latency):
     """Hard-delete files that have already been soft-deleted.
 
     Optionally, this operation can be restricted to the bucket associated with a draft
@@ -100,24 +153,491 @@ def hard_delete_files(user, pid, pid_type):
 
     # hard-delete all soft-deleted ObjectVersions
     file_instances = defaultdict(set)
+    bucket_ids = set()
     for dov in marked_as_deleted.all():
+        bucket_ids.add(dov.bucket_id)
         for ov in ObjectVersion.get_versions(dov.bucket, dov.key).all():
             ov.remove()
             if ov.file is not None:
                 file_instances[ov.key].add(ov.file)
 
-    # delete the associated FileInstances, and remove files from disk
+    # delete the associated FileInstances, and remove files from disk afterwards
+    storages = []
     for key in file_instances:
         for fi in file_instances[key]:
             try:
-                storage = fi.storage()
-                fi.delete()
-                storage.delete()
-                click.secho("{}\t{}".format(key, fi.uri), fg="red")
-            except:
+                with db.session.begin_nested():
+                    fi.delete()
+            except Exception:
                 click.secho("cannot delete file: %s" % fi.uri, fg="yellow")
+                continue
+
+            storages.append((fi.uri, fi.storage()))
+            click.secho("{}\t{}".format(key, fi.uri), fg="red")
 
+    touch_buckets(bucket_ids)
     db.session.commit()
+    throttle = Throttle(max_rate, max_latency=max_latency)
+    for uri, error in remove_from_storage(storages, jobs, throttle):
+        if error is not None:
+            click.secho("cannot delete file: %s" % uri, fg="yellow")
+
+
+def merge_duplicate_files(checksum, size):
+    """Let all objects with the given content use the same (oldest) file.
+
+    Returns the ``(uri, storage)`` pairs of the files that became unused, and have
+    been deleted from the database.
+    """
+    duplicates = (
+        FileInstance.query.filter_by(
+            checksum=checksum, size=size, readable=True, writable=False
+        )
+        .order_by(FileInstance.created, FileInstance.id)
+        .all()
+    )
+    original, duplicate_ids = duplicates[0], [fi.id for fi in duplicates[1:]]
+    objects = ObjectVersion.query.filter(ObjectVersion.file_id.in_(duplicate_ids))
+    bucket_ids = [
+        bucket_id
+        for (bucket_id,) in objects.with_entities(ObjectVersion.bucket_id).distinct()
+    ]
+    objects.update({ObjectVersion.file_id: original.id}, synchronize_session=False)
+    touch_buckets(bucket_ids)
+
+    # files that are still used by multipart uploads are kept
+    unused = unreferenced_files_query().filter(FileInstance.id.in_(duplicate_ids))
+    storages = [(fi.uri, fi.storage()) for fi in unused]
+    unused.delete(synchronize_session=False)
+    return storages
+
+
+@files.command("duplicates")
+@option_as_user
+@click.option(
+    "--merge",
+    "-m",
+    "merge",
+    default=False,
+    is_flag=True,
+    help="let duplicates use the same file, and remove the redundant copies",
+)
+@option_chunk_size
+@option_jobs
+@option_yes
+@with_appcontext
+def list_duplicate_files(user, merge, chunk_size, jobs, yes):
+    """List files whose content is stored more than once, by checksum and size.
+
+    For each content, the files and the objects (and records) using them are
+    listed, as well as the number of bytes wasted on redundant copies.
+    """
+    service = get_record_service()
+    identity = get_identity_for_user(user)
+    service.require_permission(identity, "delete" if merge else "read_files")
+
+    if merge and not yes:
+        click.confirm(
+            "are you sure you want to permanently remove duplicated files?",
+            abort=True,
+        )
+
+    num_contents, num_files, num_bytes = 0, 0, 0
+    if not merge:
+        rows = stream_query(duplicate_files_query(service), chunk_size)
+        for (checksum, size), group in groupby(rows, key=lambda row: row[:2]):
+            click.secho("{}\t{}".format(checksum, size), fg="yellow")
+            file_ids = set()
+            for _, _, file_id, uri, key, recid in group:
+                file_ids.add(file_id)
+                click.echo("\t{}\t{}\t{}".format(uri, key or "-", recid or "-"))
+
+            num_contents += 1
+            num_files += len(file_ids) - 1
+            num_bytes += (len(file_ids) - 1) * size
+
+    else:
+        contents = duplicate_contents_query()
+        columns = (FileInstance.checksum, FileInstance.size)
+        for chunk in iter_chunks(contents, columns, chunk_size=chunk_size):
+            storages, sizes = [], {}
+            for checksum, size, _ in chunk:
+                for uri, storage in merge_duplicate_files(checksum, size):
+                    storages.append((uri, storage))
+                    sizes[uri] = size
+
+                num_contents += 1
+
+            db.session.commit()
+            db.session.expunge_all()
+
+            for uri, error in remove_from_storage(storages, jobs):
+                if error is None:
+                    num_files += 1
+                    num_bytes += sizes[uri]
+                    click.secho(uri, fg="red")
+                else:
+                    click.secho("cannot delete file: %s" % uri, fg="yellow")
+
+    verb = "removed" if merge else "found"
+    click.secho(
+        "{} {} redundant files for {} contents ({} bytes)".format(
+            verb, num_files, num_contents, num_bytes
+        ),
+        fg="red" if merge else "yellow",
+        err=True,
+    )
+
+
+def _record_id_column(model_cls):
+    """Select the PID value of the records (or drafts)."""
+    return model_cls.json["id"]
+
+
+def _owners_column(model_cls):
+    """Select the owners of the records (or drafts)."""
+    return model_cls.json["access"]["owned_by"]
+
+
+@files.command("usage")
+@click.option(
+    "--by",
+    "-b",
+    "group_by",
+    type=click.Choice(["owner", "record", "bucket"]),
+    default="owner",
+    show_default=True,
+    help="how to group the storage usage",
+)
+@click.option(
+    "--refresh/--cached",
+    "-r/-C",
+    default=True,
+    help="update the cached statistics for buckets changed since the last run",
+)
+@click.option(
+    "--full-refresh",
+    "-F",
+    "full_refresh",
+    default=False,
+    is_flag=True,
+    help="recompute the cached statistics for all buckets",
+)
+@option_chunk_size
+@with_appcontext
+def show_usage(group_by, refresh, full_refresh, chunk_size):
+    """Show the storage usage per owner, record or bucket.
+
+    The number of files and bytes per bucket are aggregated on the database side,
+    and cached in a file to be refreshed incrementally.
+    Records and drafts are counted separately, as they have separate buckets.
+    """
+    cache_path = get_usage_cache_path()
+    cache = load_usage_cache(cache_path)
+    if refresh or full_refresh or cache["refreshed"] is None:
+        cache = refresh_usage_cache(cache, full=full_refresh, chunk_size=chunk_size)
+        save_usage_cache(cache_path, cache)
+
+    buckets = cache["buckets"]
+    if group_by == "bucket":
+        usage = buckets
+
+    else:
+        service = get_record_service()
+        column = _record_id_column if group_by == "record" else _owners_column
+
+        usage = defaultdict(lambda: [0, 0])
+        query = record_buckets_query(service, column)
+        for value, bucket_id in stream_query(query, chunk_size):
+            num_files, num_bytes = buckets.get(str(bucket_id), (0, 0))
+            if group_by == "record":
+                keys = [value]
+            else:
+                keys = [owner.get("user") for owner in value or []]
+
+            for key in keys:
+                usage[key][0] += num_files
+                usage[key][1] += num_bytes
+
+    if group_by == "owner":
+        emails = dict(
+            User.query.filter(User.id.in_(usage.keys())).with_entities(
+                User.id, User.email
+            )
+        )
+        usage = {
+            "{} {}".format(user_id, emails.get(user_id, "-")): stats
+            for user_id, stats in usage.items()
+        }
+
+    for key, (num_files, num_bytes) in sorted(
+        usage.items(), key=lambda item: item[1][1], reverse=True
+    ):
+        click.echo("{}\t{}\t{}".format(key, num_files, num_bytes))
+
+    click.secho(
+        "statistics as of {} UTC".format(cache["refreshed"]), fg="yellow", err=True
+    )
+
+
+@files.command("migrate")
+@click.option(
+    "--to",
+    "-T",
+    "target_name",
+    metavar="LOCATION",
+    required=True,
+    help="name of the storage location to move the files to",
+)
+@click.option(
+    "--from",
+    "-F",
+    "source_name",
+    metavar="LOCATION",
+    default=None,
+    help="name of the storage location to move the files from (default: all)",
+)
+@option_max_rate
+@option_max_bytes_rate
+@option_max_latency
+@click.option(
+    "--keep-source",
+    "keep_source",
+    default=False,
+    is_flag=True,
+    help="do not remove the files from their old location after the migration",
+)
+@option_shard
+@option_dry_run
+@option_limit
+@option_chunk_size
+@option_jobs
+@option_yes
+@with_appcontext
+def migrate_files(
+    target_name,
+    source_name,
+    max_rate,
+    max_bytes_rate,
+    max_latency,
+    keep_source,
+    shard,
+    dry_run,
+    limit,
+    chunk_size,
+    jobs,
+    yes,
+):
+    """Move files to another storage location.
+
+    The files are copied in chunks by a pool of workers, and their checksums are
+    verified during the copy.
+    After each chunk, the URIs of the successfully copied files are updated in
+    the database, and only then the files are removed from their old location.
+    Since files that are already in the target location are skipped, an
+    interrupted migration can be resumed by simply running it again.
+    """
+    locations = {}
+    for name in filter(None, [target_name, source_name]):
+        locations[name] = Location.get_by_name(name)
+        if locations[name] is None:
+            click.secho("storage location not found: %s" % name, fg="red", err=True)
+            sys.exit(1)
+
+    # the locations are detached from the session after the first chunk
+    target_uri = locations[target_name].uri
+    query = FileInstance.query.filter(
+        FileInstance.uri.isnot(None),
+        FileInstance.readable.is_(True),
+        FileInstance.writable.is_(False),
+        ~FileInstance.uri.startswith(target_uri.rstrip("/") + "/", autoescape=True),
+    )
+    if source_name:
+        source_prefix = locations[source_name].uri.rstrip("/") + "/"
+        query = query.filter(
+            FileInstance.uri.startswith(source_prefix, autoescape=True)
+        )
+
+    if shard is not None:
+        query = query.filter(shard_filter(FileInstance.id, shard))
+
+    if not (dry_run or yes):
+        click.confirm(
+            "are you sure you want to move the files to '%s'?" % target_name,
+            abort=True,
+        )
+
+    storage_class = current_app.config["FILES_REST_DEFAULT_STORAGE_CLASS"]
+    throttle = Throttle(max_rate, max_bytes_rate, max_latency)
+
+    def migrate(item):
+        _, (source, target, expected_size, expected_checksum) = item
+        uri, size, checksum = copy_file_contents(
+            source, target, expected_size, expected_checksum, throttle.bytes
+        )
+        if size != expected_size or checksum != (expected_checksum or checksum):
+            target.delete()
+            raise ValueError("checksum mismatch: %s" % checksum)
+
+        return uri, size, checksum
+
+    num_files, num_bytes, num_errors = 0, 0, 0
+    start_time = time.monotonic()
+    pool = WorkerPool(jobs, window=chunk_size, throttle=throttle, phase="storage")
+    metrics = get_metrics()
+    for chunk in iter_chunks(query, FileInstance.id, chunk_size=chunk_size):
+        if limit is not None:
+            chunk = chunk[: limit - num_files - num_errors]
+
+        if dry_run:
+            for fi in chunk:
+                click.secho("{}\t{}".format(fi.uri, fi.size), fg="yellow")
+                num_files += 1
+                num_bytes += fi.size or 0
+
+            if limit is not None and num_files >= limit:
+                break
+
+            continue
+
+        items = []
+        for fi in chunk:
+            # new URIs are generated for files without URIs
+            new_file = SimpleNamespace(
+                id=fi.id, uri=None, size=fi.size, updated=fi.updated
+            )
+            target_storage = current_files_rest.storage_factory(
+                fileinstance=new_file,
+                default_location=target_uri,
+                default_storage_class=storage_class,
+            )
+            items.append((fi, (fi.storage(), target_storage, fi.size, fi.checksum)))
+
+        old_files, stale_copies = [], []
+        for (fi, (_, target_storage, _, _)), result, error in pool.map(migrate, items):
+            if error is not None:
+                num_errors += 1
+                click.secho(
+                    "cannot migrate file: {} ({})".format(fi.uri, error),
+                    fg="yellow",
+                    err=True,
+                )
+                continue
+
+            # only switch the URI if the file hasn't changed in the meantime
+            uri, size, checksum = result
+            num_updated = FileInstance.query.filter_by(id=fi.id, uri=fi.uri).update(
+                {FileInstance.uri: uri, FileInstance.checksum: checksum},
+                synchronize_session=False,
+            )
+            if num_updated == 0:
+                num_errors += 1
+                stale_copies.append((uri, target_storage))
+                click.secho(
+                    "file changed during migration, skipping: %s" % fi.uri,
+                    fg="yellow",
+                    err=True,
+                )
+                continue
+
+            old_files.append((fi.uri, fi.storage()))
+            click.secho("{}\t{}".format(fi.uri, uri), fg="green")
+            metrics.add("storage", num_bytes=size)
+            num_files += 1
+            num_bytes += size
+
+        db.session.commit()
+        db.session.expunge_all()
+
+        # the copies of files that changed in the meantime aren't referenced
+        for uri, error in remove_from_storage(stale_copies, jobs, throttle):
+            if error is not None:
+                click.secho("cannot delete file: %s" % uri, fg="yellow")
+
+        if not keep_source:
+            for uri, error in remove_from_storage(old_files, jobs, throttle):
+                if error is not None:
+                    click.secho("cannot delete file: %s" % uri, fg="yellow")
+
+        elapsed = time.monotonic() - start_time
+        click.secho(
+            "migrated {} files ({} bytes, {:.0f} bytes/s), {} errors".format(
+                num_files, num_bytes, num_bytes / (elapsed or 1), num_errors
+            ),
+            fg="yellow",
+            err=True,
+        )
+
+        if limit is not None and num_files + num_errors >= limit:
+            break
+
+    if dry_run:
+        click.secho(
+            "would migrate {} files ({} bytes)".format(num_files, num_bytes),
+            fg="yellow",
+            err=True,
+        )
+
+    if num_errors > 0:
+        sys.exit(1)
+
+
+@files.group("buckets")
+def buckets():
+    """Management commands for buckets."""
+    pass
+
+
+@buckets.command("resync")
+@option_shard
+@option_dry_run
+@option_chunk_size
+@with_appcontext
+def resync_buckets(shard, dry_run, chunk_size):
+    """Recompute the bucket sizes from their objects' files.
+
+    The buckets are checked in chunks, and the sizes of all drifted buckets in a
+    chunk are fixed with a single UPDATE statement.
+    """
+    query = db.session.query(Bucket.id)
+    if shard is not None:
+        query = query.filter(shard_filter(Bucket.id, shard))
+
+    num_buckets, num_drifted, total_drift = 0, 0, 0
+    for chunk in iter_chunks(query, Bucket.id, chunk_size=chunk_size):
+        bucket_ids = [bucket_id for (bucket_id,) in chunk]
+        drifted = bucket_size_drift_query(bucket_ids).all()
+        for bucket_id, size, actual_size, quota_size in drifted:
+            click.secho(
+                "{}\t{}\t{}\t{:+}".format(
+                    bucket_id, size, actual_size, actual_size - size
+                ),
+                fg="yellow",
+            )
+            if quota_size is not None and actual_size > quota_size:
+                msg = "bucket exceeds its quota of {} bytes: {}"
+                click.secho(msg.format(quota_size, bucket_id), fg="red", err=True)
+
+            total_drift += actual_size - size
+
+        if drifted and not dry_run:
+            drifted_ids = [bucket_id for bucket_id, _, _, _ in drifted]
+            Bucket.query.filter(Bucket.id.in_(drifted_ids)).update(
+                {Bucket.size: bucket_size_query()}, synchronize_session=False
+            )
+            db.session.commit()
+
+        num_buckets += len(bucket_ids)
+        num_drifted += len(drifted)
+
+    verb = "found" if dry_run else "fixed"
+    click.secho(
+        "{} {} of {} buckets with drifted sizes ({:+} bytes in total)".format(
+            verb, num_drifted, num_buckets, total_drift
+        ),
+        fg="yellow",
+        err=True,
+    )
 
 
 @files.group("orphans")
@@ -127,49 +647,185 @@ def orphans():
 
 
 @orphans.command("list")
+@option_shard
+@option_chunk_size
 @with_appcontext
-def list_orphan_files():
-    """List files that aren't referenced in any records (anymore)."""
-    # TODO iterate over all records & drafts, get their buckets
-    #      and check which buckets from the db aren't listed
+def list_orphan_files(shard, chunk_size):
+    """List files that aren't referenced in any records (anymore).
+
+    A file is considered orphaned if its bucket isn't used by any record or draft.
+    """
     service = get_record_service()
-    record_model_cls = service.record_cls.model_cls
-    draft_model_cls = service.draft_cls.model_cls
-
-    bucket_ids = set(
-        (
-            r.bucket.id
-            for r in (record_model_cls.query.all() + draft_model_cls.query.all())
-            if r.bucket is not None
-        )
+    query = orphaned_files_query(service)
+    if shard is not None:
+        query = query.filter(shard_filter(ObjectVersion.bucket_id, shard))
+
+    num_files, num_bytes, num_buckets, last_bucket_id = 0, 0, 0, None
+    for uri, size, bucket_id in stream_query(query, chunk_size):
+        click.secho("{}\t{}\t{}".format(uri, size, bucket_id), fg="yellow")
+        num_files += 1
+        num_bytes += size or 0
+        if bucket_id != last_bucket_id:
+            # the rows are ordered by bucket, so counting the changes is enough
+            num_buckets += 1
+            last_bucket_id = bucket_id
+
+    click.secho(
+        "{} orphaned files in {} buckets ({} bytes)".format(
+            num_files, num_buckets, num_bytes
+        ),
+        fg="yellow",
+        err=True,
     )
-    print(len(bucket_ids))
-    buckets = Bucket.query.filter(~Bucket.id.in_(bucket_ids)).all()
-    print(len(buckets))
 
-    for bucket in buckets:
-        for ov in bucket.objects:
-            if ov.file is not None:
-                click.secho(ov.file.uri, fg="yellow")
+
+@orphans.command("scan-storage")
+@click.option(
+    "--location",
+    "-L",
+    "location_name",
+    metavar="LOCATION",
+    default=None,
+    help="name of the storage location to scan (default: the default location)",
+)
+@click.option(
+    "--min-age",
+    "min_age",
+    metavar="MINUTES",
+    type=click.IntRange(min=0),
+    default=60,
+    show_default=True,
+    help="ignore files that have been modified more recently (e.g. ongoing uploads)",
+)
+@option_shard
+@option_jobs
+@option_chunk_size
+@with_appcontext
+def scan_storage(location_name, min_age, shard, jobs, chunk_size):
+    """List files in the storage location that aren't known to the database.
+
+    The files on disk and the URIs in the database are both traversed in sorted
+    order and merged on the fly, so neither have to be held in memory.
+    When sharded, the top-level directories of the storage are partitioned.
+    """
+    if location_name:
+        location = Location.get_by_name(location_name)
+    else:
+        location = Location.get_default()
+
+    if location is None:
+        click.secho("storage location not found", fg="red", err=True)
+        sys.exit(1)
+
+    prefix = location.uri.rstrip("/")
+    root = get_local_path(prefix)
+    if root is None or not isdir(root):
+        click.secho("not a local directory: %s" % location.uri, fg="red", err=True)
+        sys.exit(1)
+
+    uris = (uri for (uri,) in stream_query(file_uris_query(prefix), chunk_size))
+    next_uri = next(uris, None)
+    max_mtime = time.time() - min_age * 60
+    num_files, num_bytes = 0, 0
+
+    def include(name):
+        return in_shard(name, shard)
+
+    for path, size, mtime in walk_files_sorted(root, jobs, include=include):
+        uri = prefix + path[len(root) :]
+        while next_uri is not None and next_uri < uri:
+            next_uri = next(uris, None)
+
+        if uri == next_uri or mtime > max_mtime:
+            continue
+
+        click.secho("{}\t{}".format(path, size), fg="yellow")
+        num_files += 1
+        num_bytes += size
+
+    click.secho(
+        "{} unreferenced files ({} bytes)".format(num_files, num_bytes),
+        fg="yellow",
+        err=True,
+    )
 
 
 @orphans.command("clean")
-@click.confirmation_option(
-    prompt="are you sure you want to permanently remove orphaned files?"
-)
 @option_as_user
+@option_shard
+@option_dry_run
+@option_limit
+@option_chunk_size
+@option_jobs
+@option_max_rate
+@option_max_latency
+@option_yes
 @with_appcontext
-def clean_files(user):
-    """Remove files that do not have associated ObjectVersions (anymore)."""
+def clean_files(
+    user, shard, dry_run, limit, chunk_size, jobs, max_rate, max_latency, yes
+):
+    """Remove files that do not have associated ObjectVersions (anymore).
+
+    The unreferenced files are selected and deleted from the database in chunks,
+    each of which is committed before the files are removed from storage.
+    """
     service = get_record_service()
     identity = get_identity_for_user(user)
     service.require_permission(identity, "delete")
 
-    for fi in (f for f in FileInstance.query.all() if not f.objects):
-        try:
-            storage = fi.storage()
-            fi.delete()
-            storage.delete()
-            click.secho(fi.uri, fg="red")
-        except:
-            click.secho("cannot delete file: %s" % fi.uri, fg="yellow")
+    if not (dry_run or yes):
+        click.confirm(
+            "are you sure you want to permanently remove orphaned files?", abort=True
+        )
+
+    query = unreferenced_files_query()
+    if shard is not None:
+        query = query.filter(shard_filter(FileInstance.id, shard))
+
+    throttle = Throttle(max_rate, max_latency=max_latency)
+    num_files, num_bytes, num_errors = 0, 0, 0
+    for chunk in iter_chunks(query, FileInstance.id, chunk_size=chunk_size):
+        if limit is not None:
+            chunk = chunk[: limit - num_files]
+
+        if dry_run:
+            for fi in chunk:
+                click.secho("{}\t{}".format(fi.uri, fi.size), fg="yellow")
+                num_files += 1
+                num_bytes += fi.size or 0
+
+        else:
+            file_ids = [fi.id for fi in chunk]
+            sizes = {fi.uri: fi.size or 0 for fi in chunk}
+            storages = {fi.id: (fi.uri, fi.storage()) for fi in chunk}
+
+            # the files could have been referenced in the meantime
+            query.filter(FileInstance.id.in_(file_ids)).delete(
+                synchronize_session=False
+            )
+            remaining = FileInstance.query.filter(FileInstance.id.in_(file_ids))
+            for (file_id,) in remaining.with_entities(FileInstance.id):
+                storages.pop(file_id)
+
+            db.session.commit()
+            db.session.expunge_all()
+
+            removals = remove_from_storage(storages.values(), jobs, throttle)
+            for uri, error in removals:
+                num_files += 1
+                if error is None:
+                    num_bytes += sizes[uri]
+                    click.secho(uri, fg="red")
+                else:
+                    num_errors += 1
+                    click.secho("cannot delete file: %s" % uri, fg="yellow")
+
+        if limit is not None and num_files >= limit:
+            break
+
+    verb = "would remove" if dry_run else "removed"
+    click.secho(
+        "{} {} files ({} bytes)".format(verb, num_files - num_errors, num_bytes),
+        fg="yellow" if dry_run else "red",
+        err=True,
+    )
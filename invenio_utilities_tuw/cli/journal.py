@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Journal for resuming interrupted bulk operations.
+
+For each job, the journal records the selected work set as well as the
+outcome for each of its items in a local SQLite database.
+When a job is resumed, only the items that haven't been completed successfully
+are processed again, without having to repeat the selection.
+"""
+
+import os
+import sqlite3
+from datetime import datetime
+from itertools import islice
+
+import click
+from flask import current_app
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    command TEXT NOT NULL,
+    created TEXT NOT NULL,
+    selected INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS items (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    PRIMARY KEY (job_id, seq)
+);
+CREATE INDEX IF NOT EXISTS items_key ON items (job_id, key);
+"""
+
+
+def get_journal_path():
+    """Get the path of the SQLite file for the job journal."""
+    path = current_app.config.get("UTILITIES_TUW_JOB_JOURNAL_PATH")
+    return path or os.path.join(current_app.instance_path, "jobs.sqlite3")
+
+
+class JobJournal(object):
+    """Journal for the work set and progress of a single job.
+
+    The work items are identified by (unique) string keys.
+    """
+
+    def __init__(self, path, job_id, command, resume=False):
+        """Constructor.
+
+        Raises a ``click.UsageError`` if the job doesn't exist but should be
+        resumed, if it exists but shouldn't be resumed, or if it was started
+        by a different command.
+        """
+        self.job_id = job_id
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(SCHEMA)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+        row = self._conn.execute(
+            "SELECT command, selected FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        if row is None and resume:
+            self.close()
+            raise click.UsageError("cannot resume unknown job: %s" % job_id)
+        elif row is not None and not resume:
+            self.close()
+            raise click.UsageError("job already exists (resume?): %s" % job_id)
+        elif row is not None and row[0] != command:
+            self.close()
+            msg = "job '{}' was started by: {}".format(job_id, row[0])
+            raise click.UsageError(msg)
+
+        if row is None:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO jobs (job_id, command, created) VALUES (?, ?, ?)",
+                    (job_id, command, datetime.utcnow().isoformat()),
+                )
+
+        self.selected = bool(row and row[1])
+
+    def _set_work_set(self, keys, batch_size=1000):
+        """Replace the job's work set with the given keys."""
+        with self._conn:
+            self._conn.execute("DELETE FROM items WHERE job_id = ?", (self.job_id,))
+
+        keys = enumerate(keys)
+        batch = list(islice(keys, batch_size))
+        while batch:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO items (job_id, seq, key) VALUES (?, ?, ?)",
+                    [(self.job_id, seq, str(key)) for seq, key in batch],
+                )
+            batch = list(islice(keys, batch_size))
+
+        with self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET selected = 1 WHERE job_id = ?", (self.job_id,)
+            )
+        self.selected = True
+
+    def pending_keys(self, batch_size=1000):
+        """Yield the keys of the work items that haven't been completed yet."""
+        last_seq = -1
+        while True:
+            rows = self._conn.execute(
+                "SELECT seq, key FROM items WHERE job_id = ? AND seq > ? AND done = 0 "
+                "ORDER BY seq LIMIT ?",
+                (self.job_id, last_seq, batch_size),
+            ).fetchall()
+            if not rows:
+                return
+
+            for _, key in rows:
+                yield key
+
+            last_seq = rows[-1][0]
+
+    def select(self, select_keys):
+        """Get the keys of the pending work items.
+
+        The work set is selected via ``select_keys()`` only if it hasn't been
+        recorded for the job yet, e.g. on its first run.
+        """
+        if not self.selected:
+            self._set_work_set(select_keys())
+
+        return self.pending_keys()
+
+    def mark(self, *keys, error=None):
+        """Record the outcome for the work items."""
+        error = None if error is None else str(error)
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE items SET done = ?, error = ? WHERE job_id = ? AND key = ?",
+                [(int(error is None), error, self.job_id, str(k)) for k in keys],
+            )
+
+    def close(self):
+        """Close the connection to the journal database."""
+        self._conn.close()
+
+
+def filter_pending(items, pending_keys, key=str):
+    """Filter the items down to the ones with pending keys.
+
+    The items are expected to be in the same order as the job's work set.
+    """
+    pending_keys = iter(pending_keys)
+    next_key = next(pending_keys, None)
+    for item in items:
+        if next_key is None:
+            return
+
+        if key(item) == next_key:
+            yield item
+            next_key = next(pending_keys, None)
+
+
+def open_journal(job_id, resume=False):
+    """Open the journal for the current command's job, if a job ID is given."""
+    if job_id is None:
+        if resume:
+            raise click.UsageError("--resume requires --job")
+
+        return None
+
+    ctx = click.get_current_context()
+    journal = JobJournal(get_journal_path(), job_id, ctx.command_path, resume=resume)
+    ctx.call_on_close(journal.close)
+    return journal
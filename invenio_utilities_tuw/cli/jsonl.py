@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Reading and writing of (compressed) JSON Lines files.
+
+Compressed files are written as a series of independently compressed blocks
+(gzip members or zstd frames), which can be produced in parallel and are
+still read as a single stream by the usual tools.
+"""
+
+import gzip
+import io
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def dumps_lines(documents):
+    """Serialize the documents as JSON Lines, and return the encoded bytes."""
+    if orjson is not None:
+        return b"".join(orjson.dumps(doc) + b"\n" for doc in documents)
+
+    return "".join(
+        json.dumps(doc, separators=(",", ":")) + "\n" for doc in documents
+    ).encode("utf-8")
+
+
+def loads_line(line):
+    """Deserialize a single line of JSON."""
+    if orjson is not None:
+        return orjson.loads(line)
+
+    return json.loads(line)
+
+
+def get_compression(path):
+    """Get the compression for the file path, based on its extension."""
+    if path.endswith(".gz"):
+        return "gzip"
+    elif path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("the 'zstandard' package is required for: %s" % path)
+
+        return "zstd"
+
+    return None
+
+
+def compress(data, compression, level=None):
+    """Compress the data as a self-contained block."""
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=level or 6)
+    elif compression == "zstd":
+        return zstandard.ZstdCompressor(level=level or 3).compress(data)
+
+    return data
+
+
+def open_lines(path):
+    """Open the (possibly compressed) JSON Lines file for reading in binary mode."""
+    compression = get_compression(path)
+    if compression == "gzip":
+        return gzip.open(path, "rb")
+    elif compression == "zstd":
+        raw = open(path, "rb")
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            raw, read_across_frames=True, closefd=True
+        )
+        return io.BufferedReader(reader)
+
+    return open(path, "rb")
+
+
+def iter_documents(path):
+    """Stream the documents from the (possibly compressed) JSON Lines file."""
+    with open_lines(path) as lines:
+        for line in lines:
+            if line.strip():
+                yield loads_line(line)
+
+
+def count_documents(path):
+    """Count the documents in the (possibly compressed) JSON Lines file."""
+    with open_lines(path) as lines:
+        return sum(1 for line in lines if line.strip())
+
+
+def get_shard_paths(path, num_shards):
+    """Get the paths for the shards of the output file.
+
+    The shard number is inserted before the file's extensions, e.g.
+    ``records.jsonl.gz`` becomes ``records-001.jsonl.gz``.
+    """
+    if num_shards <= 1:
+        return [path]
+
+    dirname, basename = os.path.split(path)
+    stem, dot, extensions = basename.partition(".")
+    return [
+        os.path.join(dirname, "{}-{:03d}{}{}".format(stem, i, dot, extensions))
+        for i in range(num_shards)
+    ]
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Performance metrics for the CLI commands.
+
+The commands record the wall time, item and byte counts, and errors for each
+phase of their work (e.g. database queries, service calls, storage I/O and
+indexing), which can be exported as a JSON summary or as a file for the
+Prometheus node exporter's textfile collector.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import click
+
+PHASE_FIELDS = ("seconds", "calls", "items", "bytes", "errors")
+"""The counters that are recorded per phase."""
+
+
+class Metrics(object):
+    """Thread-safe collector for the per-phase metrics of a command run."""
+
+    def __init__(self, command=None):
+        """Constructor."""
+        self.command = command
+        self.phases = {}
+        self.exit_code = None
+        self.start_time = time.monotonic()
+        self.end_time = None
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds=0, calls=0, items=0, num_bytes=0, errors=0):
+        """Add to the counters of the phase."""
+        values = (seconds, calls, items, num_bytes, errors)
+        with self._lock:
+            counters = self.phases.setdefault(phase, dict.fromkeys(PHASE_FIELDS, 0))
+            for field, value in zip(PHASE_FIELDS, values):
+                counters[field] += value
+
+    @contextmanager
+    def phase(self, name, items=0, num_bytes=0):
+        """Time the enclosed block as a call in the phase."""
+        start = time.monotonic()
+        errors = 0
+        try:
+            yield
+        except Exception:
+            errors = 1
+            raise
+        finally:
+            elapsed = time.monotonic() - start
+            self.add(name, elapsed, 1, items, num_bytes, errors)
+
+    def timed(self, name, iterable):
+        """Wrap the iterable, and count the time spent fetching its items."""
+        iterator = iter(iterable)
+        while True:
+            start = time.monotonic()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(name, time.monotonic() - start, 1)
+                return
+
+            self.add(name, time.monotonic() - start, items=1)
+            yield item
+
+    def finish(self, exit_code=0):
+        """Stop the clock for the command run."""
+        self.exit_code = exit_code
+        self.end_time = time.monotonic()
+
+    @property
+    def elapsed(self):
+        """The wall time of the command run (so far)."""
+        return (self.end_time or time.monotonic()) - self.start_time
+
+    def to_dict(self):
+        """Get the metrics as a JSON-serializable dictionary."""
+        with self._lock:
+            phases = {name: dict(counters) for name, counters in self.phases.items()}
+
+        return {
+            "command": self.command,
+            "exit_code": self.exit_code,
+            "seconds": self.elapsed,
+            "phases": phases,
+        }
+
+    def to_prometheus(self):
+        """Get the metrics in the Prometheus text exposition format."""
+        data = self.to_dict()
+        command = _escape_label(data["command"] or "")
+        lines = [
+            "# HELP tuw_command_duration_seconds Wall time of the command run.",
+            "# TYPE tuw_command_duration_seconds gauge",
+            'tuw_command_duration_seconds{command="%s"} %f'
+            % (command, data["seconds"]),
+            "# HELP tuw_command_exit_code Exit code of the command run.",
+            "# TYPE tuw_command_exit_code gauge",
+            'tuw_command_exit_code{command="%s"} %d'
+            % (command, data["exit_code"] or 0),
+            "# HELP tuw_command_last_run_timestamp_seconds End of the command run.",
+            "# TYPE tuw_command_last_run_timestamp_seconds gauge",
+            'tuw_command_last_run_timestamp_seconds{command="%s"} %f'
+            % (command, time.time()),
+        ]
+        for field in PHASE_FIELDS:
+            name = "tuw_phase_%s" % field
+            lines.append("# HELP %s Per-phase %s of the command run." % (name, field))
+            lines.append("# TYPE %s gauge" % name)
+            for phase, counters in sorted(data["phases"].items()):
+                lines.append(
+                    '%s{command="%s",phase="%s"} %s'
+                    % (name, command, _escape_label(phase), counters[field])
+                )
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value):
+    """Escape the value for use as a Prometheus label value."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _write_atomically(path, content):
+    """Replace the file's content atomically, or write to stderr for ``-``."""
+    if path == "-":
+        click.echo(content, err=True, nl=False)
+        return
+
+    tmp_path = "{}.tmp".format(path)
+    with open(tmp_path, "w") as output:
+        output.write(content)
+
+    os.replace(tmp_path, path)
+
+
+_current_metrics = Metrics()
+
+
+def get_metrics():
+    """Get the metrics collector for the current command run."""
+    return _current_metrics
+
+
+def start_metrics(command):
+    """Start collecting the metrics for a new command run."""
+    global _current_metrics
+    _current_metrics = Metrics(command)
+    return _current_metrics
+
+
+def export_metrics(metrics, json_path=None, textfile_path=None):
+    """Finish the command run's metrics, and write them to the given files.
+
+    The exit code is taken from the exception that is currently being handled,
+    if any.
+    """
+    error = sys.exc_info()[1]
+    if error is None:
+        exit_code = 0
+    elif isinstance(error, SystemExit):
+        exit_code = error.code if isinstance(error.code, int) else 1
+    else:
+        exit_code = getattr(error, "exit_code", 1)
+
+    metrics.finish(exit_code)
+    if json_path:
+        _write_atomically(json_path, json.dumps(metrics.to_dict(), indent=2) + "\n")
+    if textfile_path:
+        _write_atomically(textfile_path, metrics.to_prometheus())
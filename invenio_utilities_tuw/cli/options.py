@@ -43,6 +43,15 @@ option_pid_value = click.option(
     help="persistent identifier of the object to operate on",
 )
 
+option_optional_pid_value = click.option(
+    "--pid",
+    "-p",
+    "pid",
+    metavar="PID_VALUE",
+    default=None,
+    help="persistent identifier of the object to restrict the operation to",
+)
+
 option_pid_values = click.option(
     "--pid",
     "-p",
@@ -56,6 +65,18 @@ option_pid_values = click.option(
     ),
 )
 
+option_search_query = click.option(
+    "--query",
+    "-q",
+    "query",
+    metavar="QUERY",
+    default=None,
+    help=(
+        "search query for selecting the records to operate on, "
+        "e.g. 'parent.communities.ids:abcd' (cannot be combined with --pid)"
+    ),
+)
+
 option_owners = click.option(
     "--owner",
     "-o",
@@ -75,6 +96,16 @@ option_vanity_pid = click.option(
     help="vanity PID, to assign to the object (not recommended)",
 )
 
+option_link_files = click.option(
+    "--link/--copy",
+    "link",
+    default=False,
+    help=(
+        "create the files in storage as reflinks or hardlinks of the local files "
+        "if possible, falling back to copies (default: copy)"
+    ),
+)
+
 option_pretty_print = click.option(
     "--pretty-print",
     "-P",
@@ -99,3 +130,143 @@ option_hide_user_roles = click.option(
     default=False,
     help="show (or hide) the roles associated with the users",
 )
+
+# bulk operation options
+
+option_dry_run = click.option(
+    "--dry-run",
+    "-n",
+    "dry_run",
+    default=False,
+    is_flag=True,
+    help="only show what would be done, without changing anything",
+)
+
+option_limit = click.option(
+    "--limit",
+    "-l",
+    "limit",
+    metavar="N",
+    type=click.IntRange(min=1),
+    default=None,
+    help="maximum number of items to process in this run (default: no limit)",
+)
+
+option_chunk_size = click.option(
+    "--chunk-size",
+    "-c",
+    "chunk_size",
+    metavar="N",
+    type=click.IntRange(min=1),
+    default=1000,
+    show_default=True,
+    help="number of items to fetch and process per database round-trip",
+)
+
+option_jobs = click.option(
+    "--jobs",
+    "-j",
+    "jobs",
+    metavar="N",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="number of parallel workers",
+)
+
+
+def _check_positive(ctx, param, value):
+    """Reject zero as value, which would otherwise disable the limit."""
+    if value is not None and value <= 0:
+        raise click.BadParameter("expected a positive number", ctx=ctx, param=param)
+
+    return value
+
+
+option_max_rate = click.option(
+    "--max-rate",
+    "max_rate",
+    metavar="N",
+    type=click.FloatRange(min=0),
+    default=None,
+    callback=_check_positive,
+    help="maximum number of items to process per second (default: no limit)",
+)
+
+option_max_bytes_rate = click.option(
+    "--max-bytes-rate",
+    "max_bytes_rate",
+    metavar="BYTES",
+    type=click.IntRange(min=1),
+    default=None,
+    help="maximum number of bytes to copy per second (default: no limit)",
+)
+
+option_max_latency = click.option(
+    "--max-latency",
+    "max_latency",
+    metavar="SECONDS",
+    type=click.FloatRange(min=0),
+    default=None,
+    help=(
+        "back off while the round-trip time to the database or search cluster "
+        "exceeds this threshold (default: never back off)"
+    ),
+)
+
+
+def _parse_shard(ctx, param, value):
+    """Parse the shard specification ``i/N`` into a tuple of integers."""
+    if value is None:
+        return None
+
+    try:
+        index, num_shards = (int(v) for v in value.split("/"))
+    except ValueError:
+        raise click.BadParameter("expected format: i/N", ctx=ctx, param=param)
+
+    if not 0 <= index < num_shards:
+        raise click.BadParameter("expected 0 <= i < N", ctx=ctx, param=param)
+
+    return index, num_shards
+
+
+option_shard = click.option(
+    "--shard",
+    "shard",
+    metavar="i/N",
+    default=None,
+    callback=_parse_shard,
+    help=(
+        "only process the i-th of N disjoint partitions of the items (0 <= i < N), "
+        "to distribute the work across several processes or machines"
+    ),
+)
+
+option_job = click.option(
+    "--job",
+    "job_id",
+    metavar="ID",
+    default=None,
+    help=(
+        "record the work set and progress under the given job ID, "
+        "so that the operation can be resumed if it gets interrupted"
+    ),
+)
+
+option_resume = click.option(
+    "--resume",
+    "resume",
+    default=False,
+    is_flag=True,
+    help="resume the job, skipping the items that have been completed already",
+)
+
+option_yes = click.option(
+    "--yes",
+    "-y",
+    "yes",
+    default=False,
+    is_flag=True,
+    help="do not ask for confirmation",
+)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Profiling of the CLI commands with the standard library's profilers.
+
+Note that ``cProfile`` only covers the main thread, in which the time spent
+waiting for worker threads shows up as such.
+"""
+
+import cProfile
+import io
+import pstats
+import tracemalloc
+
+import click
+
+PROFILERS = ("cprofile", "tracemalloc")
+"""The supported profilers."""
+
+DEFAULT_OUTPUT_PATHS = {
+    "cprofile": "tuw-profile.pstats",
+    "tracemalloc": "tuw-profile.txt",
+}
+"""The default output file for each profiler."""
+
+
+class CommandProfiler(object):
+    """Profiler for the run time or memory allocations of a command."""
+
+    def __init__(self, profiler, output_path=None, limit=20):
+        """Constructor."""
+        self.profiler = profiler
+        self.output_path = output_path or DEFAULT_OUTPUT_PATHS[profiler]
+        self.limit = limit
+        self._profile = None
+
+    def start(self):
+        """Start profiling."""
+        if self.profiler == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            tracemalloc.start(10)
+
+    def stop(self):
+        """Stop profiling, dump the results, and print a short summary to stderr."""
+        if self.profiler == "cprofile":
+            self._profile.disable()
+            self._profile.dump_stats(self.output_path)
+            summary = io.StringIO()
+            stats = pstats.Stats(self._profile, stream=summary)
+            stats.sort_stats("cumulative").print_stats(self.limit)
+            click.secho(summary.getvalue(), err=True)
+
+        else:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            snapshot = snapshot.filter_traces(
+                [tracemalloc.Filter(False, tracemalloc.__file__)]
+            )
+            top_stats = snapshot.statistics("traceback")
+            with open(self.output_path, "w") as output:
+                output.write("peak traced memory: {} bytes\n\n".format(peak))
+                for stat in top_stats[: self.limit * 5]:
+                    output.write("{}\n".format(stat))
+                    for line in stat.traceback.format():
+                        output.write("    {}\n".format(line))
+
+            click.secho("peak traced memory: {} bytes".format(peak), err=True)
+            for stat in snapshot.statistics("lineno")[: self.limit]:
+                click.secho(str(stat), err=True)
+
+        click.secho("profile written to: %s" % self.output_path, fg="blue", err=True)
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Database queries shared by the CLI commands.
+
+The queries in here are meant to be evaluated on the database server, and their
+results to be streamed rather than loaded into memory all at once.
+"""
+
+import time
+
+from invenio_db import db
+from invenio_files_rest.models import (
+    Bucket,
+    FileInstance,
+    MultipartObject,
+    ObjectVersion,
+)
+from invenio_pidstore.models import PersistentIdentifier
+from sqlalchemy import (
+    Integer,
+    String,
+    and_,
+    cast,
+    func,
+    literal,
+    or_,
+    tuple_,
+    type_coerce,
+)
+from sqlalchemy.dialects.postgresql import BIT, JSONB
+
+from .metrics import get_metrics
+
+SHARD_HEX_DIGITS = 7
+"""The number of trailing hex digits of a UUID that determine its shard."""
+
+
+def bucket_is_referenced(service, bucket_id_column):
+    """Get a SQL condition that checks if the bucket is used by a record or draft.
+
+    The ``bucket_id_column`` is the column of the outer query, against which the
+    correlated ``EXISTS`` sub-queries are compared.
+    """
+    record_model_cls = service.record_cls.model_cls
+    draft_model_cls = service.draft_cls.model_cls
+
+    record_refs = db.session.query(record_model_cls.id).filter(
+        record_model_cls.bucket_id == bucket_id_column
+    )
+    draft_refs = db.session.query(draft_model_cls.id).filter(
+        draft_model_cls.bucket_id == bucket_id_column
+    )
+
+    return or_(record_refs.exists(), draft_refs.exists())
+
+
+def orphaned_files_query(service):
+    """Query ``(uri, size, bucket_id)`` of files in buckets without records/drafts.
+
+    The check is performed as an anti-join (``NOT EXISTS``) on the database side.
+    """
+    query = (
+        db.session.query(FileInstance.uri, FileInstance.size, ObjectVersion.bucket_id)
+        .join(ObjectVersion, ObjectVersion.file_id == FileInstance.id)
+        .filter(~bucket_is_referenced(service, ObjectVersion.bucket_id))
+        .order_by(ObjectVersion.bucket_id)
+    )
+
+    return query
+
+
+def unreferenced_files_query():
+    """Query the ``FileInstances`` that aren't used by any object (anymore).
+
+    Files that are still referenced by a multipart upload are not considered
+    unreferenced.
+    """
+    object_refs = db.session.query(ObjectVersion.version_id).filter(
+        ObjectVersion.file_id == FileInstance.id
+    )
+    multipart_refs = db.session.query(MultipartObject.upload_id).filter(
+        MultipartObject.file_id == FileInstance.id
+    )
+
+    return FileInstance.query.filter(~object_refs.exists(), ~multipart_refs.exists())
+
+
+def iter_chunks(query, column, chunk_size=1000):
+    """Iterate over the query's results in chunks, via keyset pagination.
+
+    The ``column`` (or tuple of columns) has to be unique, and its value has to
+    be accessible on the result rows via the column's key.
+    In contrast to ``LIMIT``/``OFFSET`` pagination, rows that have been deleted in
+    the meantime don't cause any results to be skipped.
+    The caller may commit and expunge the session between the chunks.
+    """
+    columns = column if isinstance(column, (list, tuple)) else (column,)
+    metrics = get_metrics()
+    last_key = None
+    while True:
+        page = query
+        if last_key is not None:
+            page = page.filter(tuple_(*columns) > tuple_(*last_key))
+
+        start = time.monotonic()
+        chunk = page.order_by(*columns).limit(chunk_size).all()
+        metrics.add("query", time.monotonic() - start, 1, len(chunk))
+        if not chunk:
+            return
+
+        # read the key before the caller gets to expire or detach the rows
+        last_key = [getattr(chunk[-1], c.key) for c in columns]
+        yield chunk
+
+
+def duplicate_contents_query():
+    """Query ``(checksum, size, num_files)`` for contents stored more than once.
+
+    Only files that are readable and not writable anymore are considered.
+    """
+    num_files = func.count(FileInstance.id)
+    query = (
+        db.session.query(
+            FileInstance.checksum, FileInstance.size, num_files.label("num_files")
+        )
+        .filter(
+            FileInstance.checksum.isnot(None),
+            FileInstance.readable.is_(True),
+            FileInstance.writable.is_(False),
+        )
+        .group_by(FileInstance.checksum, FileInstance.size)
+        .having(num_files > 1)
+    )
+
+    return query
+
+
+def duplicate_files_query(service):
+    """Query the duplicated files, with the objects and records that use them.
+
+    The rows are ``(checksum, size, file_id, uri, key, recid)`` tuples, where
+    ``key`` and ``recid`` can be ``None``.
+    They are ordered by content, so that duplicates are next to each other.
+    """
+    contents = duplicate_contents_query().subquery()
+    record_model_cls = service.record_cls.model_cls
+    draft_model_cls = service.draft_cls.model_cls
+    record_uuid = func.coalesce(record_model_cls.id, draft_model_cls.id)
+
+    query = (
+        db.session.query(
+            FileInstance.checksum,
+            FileInstance.size,
+            FileInstance.id,
+            FileInstance.uri,
+            ObjectVersion.key,
+            PersistentIdentifier.pid_value,
+        )
+        .join(
+            contents,
+            and_(
+                FileInstance.checksum == contents.c.checksum,
+                FileInstance.size == contents.c.size,
+            ),
+        )
+        .filter(FileInstance.readable.is_(True), FileInstance.writable.is_(False))
+        .outerjoin(ObjectVersion, ObjectVersion.file_id == FileInstance.id)
+        .outerjoin(
+            record_model_cls, record_model_cls.bucket_id == ObjectVersion.bucket_id
+        )
+        .outerjoin(
+            draft_model_cls, draft_model_cls.bucket_id == ObjectVersion.bucket_id
+        )
+        .outerjoin(
+            PersistentIdentifier,
+            and_(
+                PersistentIdentifier.pid_type == "recid",
+                PersistentIdentifier.object_uuid == record_uuid,
+            ),
+        )
+        .order_by(FileInstance.checksum, FileInstance.size, FileInstance.id)
+    )
+
+    return query
+
+
+def bucket_usage_query(updated_since=None):
+    """Query ``(bucket_id, num_files, num_bytes)`` for the buckets.
+
+    All object versions are taken into account, not just the latest ones.
+    If ``updated_since`` is set, only buckets updated since then are considered.
+    """
+    query = (
+        db.session.query(
+            Bucket.id,
+            func.count(FileInstance.id),
+            func.coalesce(func.sum(FileInstance.size), 0),
+        )
+        .outerjoin(ObjectVersion, ObjectVersion.bucket_id == Bucket.id)
+        .outerjoin(FileInstance, FileInstance.id == ObjectVersion.file_id)
+        .group_by(Bucket.id)
+    )
+    if updated_since is not None:
+        query = query.filter(Bucket.updated >= updated_since)
+
+    return query
+
+
+def record_buckets_query(service, column):
+    """Query ``(value, bucket_id)`` for all records and drafts with buckets.
+
+    The ``column`` is a function that takes the record (or draft) model class and
+    returns the value to select, e.g. a JSON path into the metadata.
+    """
+    queries = []
+    for model_cls in (service.record_cls.model_cls, service.draft_cls.model_cls):
+        query = db.session.query(column(model_cls), model_cls.bucket_id).filter(
+            model_cls.bucket_id.isnot(None)
+        )
+        queries.append(query)
+
+    return queries[0].union_all(*queries[1:])
+
+
+def bucket_size_query():
+    """Get a scalar query for the bucket size, as per its objects' files.
+
+    The query is correlated with the ``Bucket`` of the outer statement.
+    """
+    query = (
+        db.session.query(func.coalesce(func.sum(FileInstance.size), 0))
+        .select_from(ObjectVersion)
+        .join(FileInstance, FileInstance.id == ObjectVersion.file_id)
+        .filter(ObjectVersion.bucket_id == Bucket.id)
+    )
+
+    return query.correlate(Bucket).as_scalar()
+
+
+def bucket_size_drift_query(bucket_ids):
+    """Query ``(bucket_id, size, actual_size, quota_size)`` for drifted buckets.
+
+    Only the specified buckets are checked.
+    """
+    actual_size = bucket_size_query()
+    query = db.session.query(
+        Bucket.id, Bucket.size, actual_size.label("actual_size"), Bucket.quota_size
+    ).filter(Bucket.id.in_(bucket_ids), Bucket.size != actual_size)
+
+    return query
+
+
+def owned_records_query(model_cls, user_id):
+    """Query ``(id, recid)`` of the records (or drafts) owned by the user.
+
+    The check is performed via JSONB containment on ``access.owned_by``, and thus
+    requires PostgreSQL.
+    """
+    owners = type_coerce(model_cls.json, JSONB)["access"]["owned_by"]
+    query = db.session.query(model_cls.id, model_cls.json["id"]).filter(
+        owners.contains([{"user": user_id}])
+    )
+
+    return query
+
+
+def binary_sorted(column):
+    """Make the column sort by bytes rather than by the locale, where possible.
+
+    Useful for merging sorted query results with sorted results from Python.
+    """
+    if db.engine.dialect.name == "postgresql":
+        return column.collate("C")
+
+    return column
+
+
+def file_uris_query(prefix):
+    """Query the URIs of all files under the prefix, in bytewise order."""
+    query = (
+        db.session.query(FileInstance.uri)
+        .filter(FileInstance.uri.startswith(prefix, autoescape=True))
+        .order_by(binary_sorted(FileInstance.uri))
+    )
+
+    return query
+
+
+def shard_filter(column, shard):
+    """Get a SQL condition selecting the rows in the shard.
+
+    The ``shard`` is an ``(index, num_shards)`` tuple.
+    The rows are partitioned via the trailing hex digits of the (UUID) column's
+    value, in the same way as by ``in_shard``; this requires PostgreSQL.
+    """
+    index, num_shards = shard
+    digits = func.right(cast(column, String), SHARD_HEX_DIGITS)
+    bits = cast(literal("x", String) + digits, BIT(4 * SHARD_HEX_DIGITS))
+    return func.mod(cast(bits, Integer), num_shards) == index
+
+
+def stream_query(query, chunk_size=1000):
+    """Stream the results of the query with a server-side cursor."""
+    query = query.execution_options(stream_results=True).yield_per(chunk_size)
+    return get_metrics().timed("query", query)
@@ -9,29 +9,63 @@
 """Management commands for records."""
 
 import json
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from types import SimpleNamespace
 
 import click
 from flask.cli import with_appcontext
+from flask_principal import PermissionDenied
+from invenio_db import db
 from invenio_files_rest.models import ObjectVersion
 
 from ..utils import get_record_file_service, get_record_service
+from .bagit import BAG_FORMATS, BagWriter
+from .journal import filter_pending, open_journal
+from .jsonl import (
+    compress,
+    count_documents,
+    dumps_lines,
+    get_compression,
+    get_shard_paths,
+    iter_documents,
+)
+from .metrics import get_metrics
 from .options import (
     option_as_user,
+    option_chunk_size,
+    option_dry_run,
+    option_job,
+    option_jobs,
+    option_max_bytes_rate,
+    option_max_latency,
+    option_max_rate,
     option_owners,
     option_pid_type,
     option_pid_value,
     option_pid_values,
     option_pretty_print,
+    option_resume,
+    option_search_query,
+    option_shard,
 )
+from .queries import iter_chunks, owned_records_query, shard_filter, stream_query
+from .throttle import Throttle, ThrottledReader
 from .utils import (
+    bulk_index_records,
     convert_to_recid,
+    deferred_indexing,
     get_identity_for_user,
-    get_object_uuid,
+    iter_batches,
+    iter_selected_records,
     patch_metadata,
     set_creatibutor_names,
     set_record_owners,
+    strip_system_fields,
 )
+from .workers import WorkerPool, map_ordered
 
 
 @click.group()
@@ -42,27 +76,32 @@ def records():
 
 @records.command("list")
 @option_as_user
+@option_jobs
 @with_appcontext
-def list_records(user):
+def list_records(user, jobs):
     """List all records accessible to the given user."""
     identity = get_identity_for_user(user)
     service = get_record_service()
-    rec_model_cls = service.record_cls.model_cls
-
-    recids = [
-        rec.json["id"]
-        for rec in rec_model_cls.query
-        if rec is not None and rec.json is not None
-    ]
 
-    for recid in recids:
+    def read(recid):
+        # dump the record while its worker's database session is still active
         try:
-            rec = service.read(id_=recid, identity=identity)
-            click.secho(
-                "{} - {}".format(rec.id, rec.data["metadata"]["title"]), fg="green"
-            )
-        except:
-            raise
+            return service.read(id_=recid, identity=identity).data
+        except PermissionDenied:
+            return None
+
+    recids = (recid for _, recid in iter_selected_records())
+    pool = WorkerPool(jobs)
+    for recid, record, error in pool.map(read, recids):
+        if error is not None:
+            msg = "cannot read record {}: {}".format(recid, error)
+            click.secho(msg, fg="red", err=True)
+        elif record is not None:
+            title = record["metadata"]["title"]
+            click.secho("{} - {}".format(record["id"], title), fg="green")
+
+    if pool.summary.num_errors > 0:
+        sys.exit(1)
 
 
 @records.command("show")
@@ -119,19 +158,51 @@ def update_record(metadata_file, pid, pid_type, user, patch, owners):
 
 
 @records.command("delete")
-@click.confirmation_option(prompt="are you sure you want to delete this record?")
-@option_pid_value
+@click.confirmation_option(
+    prompt="are you sure you want to delete the selected records?"
+)
+@option_pid_values
 @option_pid_type
+@option_search_query
 @option_as_user
+@option_jobs
+@option_max_rate
+@option_max_latency
+@option_job
+@option_resume
 @with_appcontext
-def delete_record(pid, pid_type, user):
-    """Delete the specified record."""
+def delete_record(
+    pids, pid_type, query, user, jobs, max_rate, max_latency, job_id, resume
+):
+    """Delete the specified records (via their PIDs or a search query)."""
+    journal = open_journal(job_id, resume)
+    if not (pids or query or (journal is not None and journal.selected)):
+        raise click.UsageError("either --pid or --query is required")
+
     identity = get_identity_for_user(user)
-    recid = convert_to_recid(pid, pid_type)
     service = get_record_service()
-    service.delete(id_=recid, identity=identity)
 
-    click.secho(recid, fg="red")
+    def delete(recid):
+        service.delete(id_=recid, identity=identity)
+
+    recids = (recid for _, recid in iter_selected_records(pids, pid_type, query))
+    if journal is not None:
+        recids = journal.select(lambda: recids)
+
+    pool = WorkerPool(jobs, throttle=Throttle(max_rate, max_latency=max_latency))
+    for recid, _, error in pool.map(delete, recids):
+        if journal is not None:
+            journal.mark(recid, error=error)
+
+        if error is None:
+            click.secho(recid, fg="red")
+        else:
+            msg = "cannot delete record {}: {}".format(recid, error)
+            click.secho(msg, fg="yellow", err=True)
+
+    pool.summary.echo("records")
+    if pool.summary.num_errors > 0:
+        sys.exit(1)
 
 
 @records.group()
@@ -158,26 +229,53 @@ def list_files(pid, pid_type, user):
 
 
 @files.command("verify")
-@option_pid_value
+@option_pid_values
 @option_pid_type
+@option_search_query
+@option_shard
 @option_as_user
+@option_jobs
+@option_max_rate
+@option_max_latency
 @with_appcontext
-def verify_files(pid, pid_type, user):
-    """Verify the checksums for each of the record's files."""
-    recid = convert_to_recid(pid, pid_type)
+def verify_files(pids, pid_type, query, shard, user, jobs, max_rate, max_latency):
+    """Verify the checksums for each of the selected records' files.
+
+    If neither PIDs nor a search query are specified, all records are verified.
+    """
     identity = get_identity_for_user(user)
     service = get_record_file_service()
     service.require_permission(identity, "read_files")
-    record = service.read(id_=recid, identity=identity)
-    record = record._record if hasattr(record, "_record") else record
     num_errors = 0
 
-    for name, rec_file in record.files.entries.items():
-        if rec_file.file.verify_checksum():
-            click.secho(name, fg="green")
-        else:
-            click.secho("{}: failed checksum verification".format(name), fg="red")
+    def verify(recid):
+        record = service.read(id_=recid, identity=identity)
+        record = record._record if hasattr(record, "_record") else record
+        return [
+            (name, rec_file.file.verify_checksum())
+            for name, rec_file in record.files.entries.items()
+        ]
+
+    selected = iter_selected_records(pids, pid_type, query, shard=shard)
+    recids = (recid for _, recid in selected)
+    pool = WorkerPool(jobs, throttle=Throttle(max_rate, max_latency=max_latency))
+    for recid, checks, error in pool.map(verify, recids):
+        if error is not None:
+            msg = "cannot verify record {}: {}".format(recid, error)
+            click.secho(msg, fg="red", err=True)
             num_errors += 1
+            continue
+
+        for name, valid in checks:
+            if len(pids) != 1:
+                name = "{}\t{}".format(recid, name)
+
+            if valid:
+                click.secho(name, fg="green")
+            else:
+                msg = "{}: failed checksum verification".format(name)
+                click.secho(msg, fg="red")
+                num_errors += 1
 
     if num_errors > 0:
         click.secho(
@@ -186,30 +284,457 @@ def verify_files(pid, pid_type, user):
         sys.exit(1)
 
 
+@records.command("export")
+@click.argument(
+    "output_path",
+    metavar="OUTPUT",
+    type=click.Path(dir_okay=False, writable=True),
+)
+@option_pid_values
+@option_pid_type
+@option_search_query
+@click.option(
+    "--shards",
+    "-s",
+    "num_shards",
+    metavar="N",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="number of output files to distribute the records across",
+)
+@option_shard
+@option_chunk_size
+@option_jobs
+@with_appcontext
+def export_records(
+    output_path, pids, pid_type, query, num_shards, shard, chunk_size, jobs
+):
+    """Export all (or just the selected) records as JSON Lines.
+
+    The records' metadata is exported as stored in the database.
+    If the OUTPUT path ends with ".gz" or ".zst", the output is compressed.
+    The records are streamed from the database with a server-side cursor, and
+    serialized and compressed in chunks by a pool of worker threads.
+    """
+    service = get_record_service()
+    model_cls = service.record_cls.model_cls
+    try:
+        compression = get_compression(output_path)
+    except RuntimeError as error:
+        click.secho(str(error), fg="red", err=True)
+        sys.exit(1)
+
+    if pids or query:
+        selected = iter_selected_records(
+            pids, pid_type, query, chunk_size=chunk_size, shard=shard
+        )
+        rows = (
+            row
+            for batch in iter_batches(selected, chunk_size)
+            for row in db.session.query(model_cls.json).filter(
+                model_cls.id.in_([uuid for uuid, _ in batch])
+            )
+        )
+    else:
+        rows = db.session.query(model_cls.json)
+        if shard is not None:
+            rows = rows.filter(shard_filter(model_cls.id, shard))
+
+        rows = stream_query(rows, chunk_size)
+
+    documents = (data for (data,) in rows if data is not None)
+
+    def serialize(batch):
+        return len(batch), compress(dumps_lines(batch), compression)
+
+    num_records = 0
+    paths = get_shard_paths(output_path, num_shards)
+    with ExitStack() as stack:
+        outputs = [stack.enter_context(open(path, "wb")) for path in paths]
+        executor = stack.enter_context(ThreadPoolExecutor(max_workers=jobs))
+        batches = iter_batches(documents, chunk_size)
+        blocks = map_ordered(executor, serialize, batches, window=2 * jobs)
+        for i, (num_documents, block) in enumerate(blocks):
+            outputs[i % num_shards].write(block)
+            num_records += num_documents
+
+    click.secho(
+        "exported {} records to: {}".format(num_records, ", ".join(paths)),
+        fg="green",
+        err=True,
+    )
+
+
+@records.command("import")
+@click.argument(
+    "input_path",
+    metavar="INPUT",
+    type=click.Path(exists=True, dir_okay=False),
+)
+@option_as_user
+@option_owners
+@click.option(
+    "--publish/--no-publish",
+    default=True,
+    help="publish the created drafts (default: publish)",
+)
+@option_chunk_size
+@option_max_rate
+@option_max_latency
+@option_job
+@option_resume
+@with_appcontext
+def import_records(
+    input_path,
+    user,
+    owners,
+    publish,
+    chunk_size,
+    max_rate,
+    max_latency,
+    job_id,
+    resume,
+):
+    """Create records from the metadata in the JSON Lines file.
+
+    The INPUT file can be compressed (".gz" or ".zst"), e.g. from "export".
+    Each line is treated like the metadata file for "drafts create", except that
+    fields managed by the system (like the ID) are ignored.
+    Files are not imported, so the records' files are disabled.
+    Indexing is deferred to the end of each chunk, and performed in bulk.
+    Resumed jobs skip the lines that have been imported already.
+    """
+    journal = open_journal(job_id, resume)
+    identity = get_identity_for_user(user)
+    service = get_record_service()
+    if owners:
+        owners = [get_identity_for_user(owner) for owner in owners]
+
+    throttle = Throttle(max_rate, max_latency=max_latency)
+    metrics = get_metrics()
+    num_records, num_errors = 0, 0
+    documents = enumerate(iter_documents(input_path), start=1)
+    if journal is not None:
+        pending = journal.select(lambda: range(1, count_documents(input_path) + 1))
+        documents = filter_pending(documents, pending, key=lambda d: str(d[0]))
+
+    for batch in iter_batches(documents, chunk_size):
+        with deferred_indexing(service) as indexer:
+            for line_number, document in batch:
+                throttle.acquire()
+                metadata = strip_system_fields(document)
+                metadata["files"] = {"enabled": False}
+                if owners:
+                    metadata = set_record_owners(metadata, owners)
+
+                metadata = set_creatibutor_names(metadata)
+                try:
+                    with metrics.phase("service", items=1):
+                        draft = service.create(identity=identity, data=metadata)
+                        if publish:
+                            service.publish(id_=draft.id, identity=identity)
+
+                except Exception as error:
+                    db.session.rollback()
+                    num_errors += 1
+                    msg = "cannot import line {}: {}".format(line_number, error)
+                    click.secho(msg, fg="red", err=True)
+                    if journal is not None:
+                        journal.mark(line_number, error=error)
+
+                    continue
+
+                if journal is not None:
+                    journal.mark(line_number)
+
+                click.secho(draft.id, fg="green")
+                num_records += 1
+
+            indexer.flush()
+
+    click.secho(
+        "imported {} records, {} errors".format(num_records, num_errors),
+        fg="yellow" if num_errors else "green",
+        err=True,
+    )
+    if num_errors > 0:
+        sys.exit(1)
+
+
+@records.command("export-bag")
+@click.argument(
+    "output_dir",
+    metavar="OUTPUT_DIR",
+    type=click.Path(file_okay=False, writable=True),
+)
+@option_pid_values
+@option_pid_type
+@option_search_query
+@option_as_user
+@click.option(
+    "--format",
+    "-f",
+    "bag_format",
+    type=click.Choice(list(BAG_FORMATS)),
+    default="tar",
+    show_default=True,
+    help="archive format for the bags",
+)
+@option_shard
+@option_jobs
+@option_max_rate
+@option_max_bytes_rate
+@option_max_latency
+@option_job
+@option_resume
+@with_appcontext
+def export_bags(
+    output_dir,
+    pids,
+    pid_type,
+    query,
+    user,
+    bag_format,
+    shard,
+    jobs,
+    max_rate,
+    max_bytes_rate,
+    max_latency,
+    job_id,
+    resume,
+):
+    """Package all (or just the selected) records as BagIt bags.
+
+    Each record is packaged as an archive in the OUTPUT_DIR, named after its ID.
+    The bag's payload consists of "metadata.json" and the record's files in
+    "files/", so that its "data/" directory can be used with "drafts create".
+    The files are streamed from storage into the archives, with the manifest
+    checksums computed on the fly, and several records are packaged in parallel.
+    """
+    identity = get_identity_for_user(user)
+    service = get_record_service()
+    journal = open_journal(job_id, resume)
+    throttle = Throttle(max_rate, max_bytes_rate, max_latency)
+    metrics = get_metrics()
+    os.makedirs(output_dir, exist_ok=True)
+
+    selected = iter_selected_records(pids, pid_type, query, shard=shard)
+    recids = (recid for _, recid in selected)
+    if journal is not None:
+        recids = journal.select(lambda: recids)
+
+    def package(recid):
+        path = os.path.join(output_dir, recid + BAG_FORMATS[bag_format])
+        bag = None
+        try:
+            record = service.read(id_=recid, identity=identity)
+            metadata = strip_system_fields(record.data)
+            record = record._record if hasattr(record, "_record") else record
+            service.require_permission(identity, "read_files", record=record)
+
+            entries = record.files.entries
+            metadata["files"] = {"enabled": bool(entries)}
+            bag = BagWriter(path, recid, bag_format)
+            bag.add_payload_bytes(
+                "metadata.json", json.dumps(metadata, indent=2).encode("utf-8")
+            )
+            for key, rec_file in entries.items():
+                with rec_file.file.storage().open() as stream:
+                    stream = ThrottledReader(stream, throttle.bytes)
+                    name = "files/{}".format(key)
+                    bag.add_payload(name, stream, rec_file.file.size)
+
+            bag.close({"External-Identifier": recid})
+            metrics.add("storage", num_bytes=bag.payload_bytes)
+
+        except Exception:
+            if bag is not None:
+                bag.abort()
+            if os.path.exists(path):
+                os.remove(path)
+
+            raise
+
+    pool = WorkerPool(jobs, throttle=throttle, phase="storage")
+    for recid, _, error in pool.map(package, recids):
+        if journal is not None:
+            journal.mark(recid, error=error)
+
+        if error is None:
+            click.secho(recid, fg="green")
+        else:
+            msg = "cannot package record {}: {}".format(recid, error)
+            click.secho(msg, fg="red", err=True)
+
+    if pool.summary.num_errors > 0:
+        sys.exit(1)
+
+
+@records.command("chown")
+@click.option(
+    "--from",
+    "-F",
+    "old_owner",
+    metavar="USER",
+    required=True,
+    help="email address (or ID) of the current owner",
+)
+@click.option(
+    "--to",
+    "-T",
+    "new_owner",
+    metavar="USER",
+    required=True,
+    help="email address (or ID) of the new owner",
+)
+@option_search_query
+@option_shard
+@option_dry_run
+@option_chunk_size
+@option_max_rate
+@option_max_latency
+@with_appcontext
+def change_owner(
+    old_owner, new_owner, query, shard, dry_run, chunk_size, max_rate, max_latency
+):
+    """Transfer the ownership of all records (and drafts) from one user to another.
+
+    Other owners of the records are kept.
+    Optionally, the records can be restricted further via a search query.
+    The affected records are selected via their "access.owned_by" field in the
+    database, updated in committed chunks, and reindexed in bulk per chunk.
+    """
+    old_owner = get_identity_for_user(old_owner)
+    new_owner = get_identity_for_user(new_owner)
+    service = get_record_service()
+    throttle = Throttle(max_rate, max_latency=max_latency)
+    metrics = get_metrics()
+
+    num_records = 0
+    for api_cls in (service.record_cls, service.draft_cls):
+        model_cls = api_cls.model_cls
+        owned = owned_records_query(model_cls, old_owner.id)
+        if shard is not None:
+            owned = owned.filter(shard_filter(model_cls.id, shard))
+
+        if query:
+            # the shard has already been applied to the owned records
+            selected = iter_selected_records(
+                query=query, record_cls=api_cls, chunk_size=chunk_size
+            )
+            chunks = (
+                owned.filter(model_cls.id.in_([uuid for uuid, _ in batch])).all()
+                for batch in iter_batches(selected, chunk_size)
+            )
+        else:
+            chunks = iter_chunks(owned, model_cls.id, chunk_size=chunk_size)
+
+        for chunk in chunks:
+            if dry_run:
+                for _, recid in chunk:
+                    click.secho(recid, fg="yellow")
+
+                num_records += len(chunk)
+                continue
+
+            throttle.acquire(len(chunk))
+            with metrics.phase("service", items=len(chunk)):
+                records = api_cls.get_records([record_id for record_id, _ in chunk])
+                for record in records:
+                    owner_ids = [o.get("user") for o in record["access"]["owned_by"]]
+                    owner_ids = [
+                        new_owner.id if owner_id == old_owner.id else owner_id
+                        for owner_id in owner_ids
+                    ]
+                    owners = [
+                        SimpleNamespace(id=oid) for oid in dict.fromkeys(owner_ids)
+                    ]
+                    record["access"] = set_record_owners(record, owners)["access"]
+                    record.commit()
+
+                db.session.commit()
+
+            if api_cls is service.record_cls:
+                bulk_index_records(service.indexer, [r.id for r in records])
+            else:
+                with metrics.phase("indexing", items=len(records)):
+                    for draft in records:
+                        service.indexer.index(draft)
+
+            for record in records:
+                click.secho(record["id"], fg="green")
+
+            num_records += len(records)
+
+    verb = "would change" if dry_run else "changed"
+    click.secho(
+        "{} the owner of {} records and drafts".format(verb, num_records),
+        fg="yellow" if dry_run else "green",
+        err=True,
+    )
+
+
 @records.command("reindex")
 @option_pid_values
 @option_pid_type
+@option_search_query
+@option_shard
 @option_as_user
+@option_chunk_size
+@option_jobs
+@option_max_rate
+@option_max_latency
+@option_job
+@option_resume
 @with_appcontext
-def reindex_records(pids, pid_type, user):
-    """Reindex all available (or just the specified) records."""
+def reindex_records(
+    pids,
+    pid_type,
+    query,
+    shard,
+    user,
+    chunk_size,
+    jobs,
+    max_rate,
+    max_latency,
+    job_id,
+    resume,
+):
+    """Reindex all available (or just the selected) records.
+
+    The records are loaded and indexed in chunks, several chunks in parallel.
+    """
     service = get_record_service()
 
     # basically, this is just a check whether the user exists,
     # since there's no permission for re-indexing
     get_identity_for_user(user)
+    journal = open_journal(job_id, resume)
 
-    if pids:
-        records = [
-            service.record_cls.get_record(get_object_uuid(pid, pid_type))
-            for pid in pids
-        ]
-    else:
-        records = [
-            service.record_cls.get_record(meta.id)
-            for meta in service.record_cls.model_cls.query
-            if meta is not None and meta.json is not None
-        ]
+    throttle = Throttle(max_rate, max_latency=max_latency)
 
-    for record in records:
-        service.indexer.index(record)
+    def reindex(uuids):
+        throttle.acquire(len(uuids))
+        for record in service.record_cls.get_records(uuids):
+            service.indexer.index(record)
+
+    selected = iter_selected_records(
+        pids, pid_type, query, chunk_size=chunk_size, shard=shard
+    )
+    uuids = (str(uuid) for uuid, _ in selected)
+    if journal is not None:
+        uuids = journal.select(lambda: uuids)
+
+    pool = WorkerPool(jobs, phase="indexing")
+    for batch, _, error in pool.map(reindex, iter_batches(uuids, chunk_size)):
+        if journal is not None:
+            journal.mark(*batch, error=error)
+
+        if error is not None:
+            msg = "cannot reindex records {}: {}".format(", ".join(batch), error)
+            click.secho(msg, fg="red", err=True)
+
+    pool.summary.echo("chunks")
+    if pool.summary.num_errors > 0:
+        sys.exit(1)
@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Generator for synthetic repository contents, for load testing.
+
+The rows are generated in memory and written via bulk inserts on the tables,
+bypassing the services (and thus the indexer, the permission checks and the
+version history of the records).
+The file contents (if written at all) are zero-filled, and their checksums are
+random.
+"""
+
+import math
+import os
+import random
+import string
+import uuid
+from datetime import datetime, timedelta
+
+from flask_principal import Identity
+from invenio_accounts.models import User
+from invenio_db import db
+from invenio_files_rest.models import Bucket, FileInstance, ObjectVersion
+from invenio_pidstore.models import PersistentIdentifier, PIDStatus
+
+from ..utils import get_record_service
+from .utils import set_creatibutor_names, set_record_owners
+
+SIZE_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+"""The supported distributions for the file sizes."""
+
+BATCH_SIZE = 5000
+"""The default number of records per bulk insert."""
+
+
+def size_sampler(distribution, size, rng):
+    """Get a function for sampling file sizes.
+
+    The ``size`` is the exact size for the "fixed" distribution, the mean for
+    the "uniform" distribution, and the median for the "lognormal" distribution.
+    """
+    if distribution == "fixed":
+        return lambda: size
+    elif distribution == "uniform":
+        return lambda: rng.randint(0, 2 * size)
+    elif distribution == "lognormal":
+        mu = math.log(max(size, 1))
+        return lambda: int(rng.lognormvariate(mu, 1.5))
+
+    raise ValueError("unknown size distribution: %s" % distribution)
+
+
+def random_recid(rng):
+    """Generate a random PID value in the style of InvenioRDM."""
+    alphabet = string.ascii_lowercase + string.digits
+    parts = ["".join(rng.choice(alphabet) for _ in range(5)) for _ in range(2)]
+    return "-".join(parts)
+
+
+class RepositorySeeder(object):
+    """Bulk-inserts synthetic users, records, drafts and files.
+
+    The rows are buffered, and flushed (and committed) after every
+    ``batch_size`` records.
+    With a ``seed``, the generated rows (including their IDs) are reproducible,
+    so each seed can only be used once per database.
+    """
+
+    def __init__(
+        self,
+        location,
+        file_size=100000,
+        size_distribution="lognormal",
+        max_files=3,
+        write_files=False,
+        batch_size=BATCH_SIZE,
+        seed=None,
+    ):
+        """Constructor."""
+        self.location = location
+        self.rng = random.Random(seed)
+        self.sample_size = size_sampler(size_distribution, file_size, self.rng)
+        self.max_files = max_files
+        self.write_files = write_files
+        self.batch_size = batch_size
+        self.service = get_record_service()
+        self.now = datetime.utcnow()
+        self.counts = {}
+        self._rows = {}
+
+    def _add(self, model_cls, row):
+        """Buffer the row for insertion into the model's table."""
+        self._rows.setdefault(model_cls, []).append(row)
+
+    def _set_pid_pks(self, pid_rows):
+        """Write the primary keys of the inserted PIDs into the buffered metadata."""
+        pid_values = [row["pid_value"] for row in pid_rows]
+        query = db.session.query(
+            PersistentIdentifier.pid_value, PersistentIdentifier.id
+        ).filter(
+            PersistentIdentifier.pid_type == "recid",
+            PersistentIdentifier.pid_value.in_(pid_values),
+        )
+        pks = dict(query)
+        for model_cls in (
+            self.service.record_cls.model_cls,
+            self.service.draft_cls.model_cls,
+        ):
+            for row in self._rows.get(model_cls, []):
+                row["json"]["pid"]["pk"] = pks[row["json"]["id"]]
+
+    def flush(self):
+        """Insert the buffered rows in the order of their foreign keys, and commit.
+
+        The metadata of the records and drafts refer to their PIDs' primary keys,
+        which are only known after the PIDs have been inserted.
+        """
+        for model_cls in (
+            User,
+            Bucket,
+            FileInstance,
+            ObjectVersion,
+            PersistentIdentifier,
+            self.service.record_cls.model_cls,
+            self.service.draft_cls.model_cls,
+        ):
+            rows = self._rows.pop(model_cls, [])
+            if rows:
+                db.session.execute(model_cls.__table__.insert(), rows)
+                if model_cls is PersistentIdentifier:
+                    self._set_pid_pks(rows)
+
+                name = model_cls.__tablename__
+                self.counts[name] = self.counts.get(name, 0) + len(rows)
+
+        db.session.commit()
+
+    def seed_users(self, num_users):
+        """Create users with unique email addresses, and return their IDs."""
+        tag = "%08x" % self.rng.getrandbits(32)
+        pattern = "seed-{}-{{}}@example.org".format(tag)
+        for i in range(num_users):
+            row = {
+                "email": pattern.format(i),
+                "password": None,
+                "active": True,
+                "confirmed_at": self.now,
+            }
+            self._add(User, row)
+            if (i + 1) % self.batch_size == 0:
+                self.flush()
+
+        self.flush()
+        query = db.session.query(User.id).filter(User.email.like(pattern.format("%")))
+        return [user_id for (user_id,) in query]
+
+    def _uuid(self):
+        """Generate a (version 4) UUID from the random number generator."""
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def _file(self, size):
+        """Buffer a file instance with the given size, and return its ID."""
+        file_id = str(self._uuid())
+        uri = os.path.join(
+            self.location.uri, file_id[:2], file_id[2:4], file_id[4:], "data"
+        )
+        if self.write_files:
+            os.makedirs(os.path.dirname(uri), exist_ok=True)
+            with open(uri, "wb") as data:
+                data.truncate(size)
+
+        self._add(
+            FileInstance,
+            {
+                "id": file_id,
+                "uri": uri,
+                "storage_class": "S",
+                "size": size,
+                "checksum": "md5:%032x" % self.rng.getrandbits(128),
+                "readable": True,
+                "writable": False,
+                "last_check": True,
+            },
+        )
+        return file_id
+
+    def _object(self, bucket_id, key, file_id, is_head=True):
+        """Buffer an object version (or a delete marker, without file)."""
+        self._add(
+            ObjectVersion,
+            {
+                "version_id": self._uuid(),
+                "bucket_id": bucket_id,
+                "key": key,
+                "file_id": file_id,
+                "is_head": is_head,
+            },
+        )
+
+    def _bucket(self, num_files, soft_deleted=False):
+        """Buffer a bucket with files, and return its ID.
+
+        If requested, the bucket additionally contains a soft-deleted file.
+        """
+        bucket_id = self._uuid()
+        total = 0
+        for i in range(num_files):
+            size = self.sample_size()
+            self._object(bucket_id, "file-%d.bin" % i, self._file(size))
+            total += size
+
+        if soft_deleted:
+            size = self.sample_size()
+            self._object(bucket_id, "deleted.bin", self._file(size), is_head=False)
+            self._object(bucket_id, "deleted.bin", None)
+            total += size
+
+        self._add(
+            Bucket,
+            {
+                "id": bucket_id,
+                "default_location": self.location.id,
+                "default_storage_class": "S",
+                "size": total,
+                "locked": False,
+                "deleted": False,
+            },
+        )
+        return bucket_id
+
+    def _metadata(self, recid, owner_id, pid_status):
+        """Generate the metadata for a record or draft.
+
+        The PID's primary key is filled in when the rows are flushed.
+        """
+        metadata = {
+            "id": recid,
+            "pid": {
+                "pk": None,
+                "status": pid_status,
+                "pid_type": "recid",
+                "obj_type": "rec",
+            },
+            "access": {"record": "public", "files": "public"},
+            "files": {"enabled": True},
+            "metadata": {
+                "title": "Synthetic record %s" % recid,
+                "publication_date": "2021-%02d-01" % self.rng.randint(1, 12),
+                "resource_type": {"type": "dataset"},
+                "creators": [
+                    {
+                        "person_or_org": {
+                            "type": "personal",
+                            "given_name": "Given",
+                            "family_name": "Family %d" % self.rng.randint(1, 1000),
+                        }
+                    }
+                ],
+            },
+        }
+        if owner_id is not None:
+            metadata = set_record_owners(metadata, [Identity(owner_id)])
+
+        return set_creatibutor_names(metadata)
+
+    def _record_or_draft(self, owner_ids, published, edit_ratio, soft_delete_ratio):
+        """Buffer a published record (possibly with a draft) or a new draft."""
+        recid = random_recid(self.rng)
+        object_id = self._uuid()
+        owner_id = self.rng.choice(owner_ids) if owner_ids else None
+        num_files = self.rng.randint(1, self.max_files) if self.max_files else 0
+
+        status = PIDStatus.REGISTERED if published else PIDStatus.NEW
+        self._add(
+            PersistentIdentifier,
+            {
+                "pid_type": "recid",
+                "pid_value": recid,
+                "object_type": "rec",
+                "object_uuid": object_id,
+                "status": status,
+            },
+        )
+
+        if published:
+            soft_deleted = self.rng.random() < soft_delete_ratio
+            self._add(
+                self.service.record_cls.model_cls,
+                {
+                    "id": object_id,
+                    "json": self._metadata(recid, owner_id, status.value),
+                    "version_id": 1,
+                    "bucket_id": self._bucket(num_files, soft_deleted),
+                },
+            )
+
+        if not published or self.rng.random() < edit_ratio:
+            soft_deleted = self.rng.random() < soft_delete_ratio
+            self._add(
+                self.service.draft_cls.model_cls,
+                {
+                    "id": object_id,
+                    "json": self._metadata(recid, owner_id, status.value),
+                    "version_id": 1,
+                    "fork_version_id": 1 if published else None,
+                    "bucket_id": self._bucket(num_files, soft_deleted),
+                    "expires_at": self.now + timedelta(days=30),
+                },
+            )
+
+    def seed_records(
+        self,
+        num_records,
+        num_drafts=0,
+        owner_ids=None,
+        edit_ratio=0.1,
+        soft_delete_ratio=0.1,
+        progress=None,
+    ):
+        """Create published records and new drafts, with files.
+
+        A share of ``edit_ratio`` of the records additionally get a draft, and
+        a share of ``soft_delete_ratio`` of the buckets contain a soft-deleted
+        file.
+        The owners are picked from the given user IDs at random.
+        """
+        kinds = [True] * num_records + [False] * num_drafts
+        self.rng.shuffle(kinds)
+        for start in range(0, len(kinds), self.batch_size):
+            batch = kinds[start : start + self.batch_size]
+            for published in batch:
+                self._record_or_draft(
+                    owner_ids, published, edit_ratio, soft_delete_ratio
+                )
+
+            self.flush()
+            if progress is not None:
+                progress(len(batch))
+
+    def seed_orphans(self, num_buckets=0, num_files=0):
+        """Create buckets without records, and files without objects."""
+        for i in range(num_buckets):
+            self._bucket(self.rng.randint(0, self.max_files))
+            if (i + 1) % self.batch_size == 0:
+                self.flush()
+
+        for i in range(num_files):
+            self._file(self.sample_size())
+            if (i + 1) % self.batch_size == 0:
+                self.flush()
+
+        self.flush()
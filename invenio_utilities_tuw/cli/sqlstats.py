@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Statistics about the SQL statements issued by the CLI commands.
+
+The statements are grouped by their normalized text (i.e. with literals and
+parameters replaced by placeholders), so that statements which are issued
+once per row rather than once per chunk (the "N+1 queries" pattern) stand out.
+"""
+
+import re
+import threading
+import time
+
+import click
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_PARAMETERS = re.compile(r"%\(\w+\)s|%s|\?")
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(statement):
+    """Replace the literals and parameters in the SQL statement by placeholders.
+
+    Lists of placeholders (e.g. for ``IN``) are collapsed into a single one.
+    """
+    statement = _PARAMETERS.sub("?", statement)
+    statement = _STRINGS.sub("?", statement)
+    statement = _NUMBERS.sub("?", statement)
+    statement = _LISTS.sub("(?)", statement)
+    return _WHITESPACE.sub(" ", statement).strip()
+
+
+class SQLStats(object):
+    """Collector for the number and duration of SQL statements, per pattern.
+
+    The collector listens to the events of all SQLAlchemy engines while it is
+    installed, e.g. as a context manager.
+    """
+
+    def __init__(self, repeat_threshold=20):
+        """Constructor.
+
+        Patterns that are executed at least ``repeat_threshold`` times are
+        flagged as potential N+1 queries.
+        """
+        self.repeat_threshold = repeat_threshold
+        self.patterns = {}
+        self._lock = threading.Lock()
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, many):
+        """Remember the start time of the statement on the connection."""
+        conn.info.setdefault("tuw_query_start", []).append(time.monotonic())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, many):
+        """Count the statement's execution and duration for its pattern."""
+        elapsed = time.monotonic() - conn.info["tuw_query_start"].pop()
+        pattern = normalize_sql(statement)
+        with self._lock:
+            count, seconds = self.patterns.get(pattern, (0, 0))
+            self.patterns[pattern] = (count + 1, seconds + elapsed)
+
+    def install(self):
+        """Start listening to the statements executed by any engine."""
+        event.listen(Engine, "before_cursor_execute", self._before_execute)
+        event.listen(Engine, "after_cursor_execute", self._after_execute)
+
+    def uninstall(self):
+        """Stop listening to the executed statements."""
+        event.remove(Engine, "before_cursor_execute", self._before_execute)
+        event.remove(Engine, "after_cursor_execute", self._after_execute)
+
+    def __enter__(self):
+        """Install the listeners."""
+        self.install()
+        return self
+
+    def __exit__(self, *exc_info):
+        """Uninstall the listeners."""
+        self.uninstall()
+
+    @property
+    def num_statements(self):
+        """The total number of executed statements."""
+        return sum(count for count, _ in self.patterns.values())
+
+    @property
+    def repeated_patterns(self):
+        """Get ``(pattern, count, seconds)`` for the patterns above the threshold.
+
+        The patterns are sorted by their number of executions, descending.
+        """
+        repeated = [
+            (pattern, count, seconds)
+            for pattern, (count, seconds) in self.patterns.items()
+            if count >= self.repeat_threshold
+        ]
+        return sorted(repeated, key=lambda r: r[1], reverse=True)
+
+    def report(self, limit=10):
+        """Print the statistics for the most expensive patterns to stderr."""
+        patterns = sorted(self.patterns.items(), key=lambda p: p[1][1], reverse=True)
+        total_seconds = sum(seconds for _, seconds in self.patterns.values())
+        click.secho(
+            "{} SQL statements in {:.3f}s, {} distinct patterns".format(
+                self.num_statements, total_seconds, len(self.patterns)
+            ),
+            fg="blue",
+            err=True,
+        )
+        for pattern, (count, seconds) in patterns[:limit]:
+            line = "{:8d}x {:9.3f}s  {}".format(count, seconds, pattern[:160])
+            click.secho(line, fg="blue", err=True)
+
+        for pattern, count, _ in self.repeated_patterns:
+            msg = "possible N+1 query ({} executions): {}".format(count, pattern[:160])
+            click.secho(msg, fg="yellow", err=True)
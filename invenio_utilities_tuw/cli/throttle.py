@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Throttling of bulk operations.
+
+Besides fixed caps on the throughput, bulk operations can back off adaptively
+when the round-trip latency of the database or search cluster rises, e.g. due
+to user-facing load on a production system.
+"""
+
+import threading
+import time
+
+from invenio_db import db
+from invenio_search import current_search_client
+from sqlalchemy import text
+
+
+class RateLimiter(object):
+    """Thread-safe token bucket, limiting the consumption of units per second."""
+
+    def __init__(self, rate=None, burst=None):
+        """Constructor.
+
+        A ``rate`` of ``None`` disables the limit.
+        The ``burst`` is the number of units that can be consumed at once without
+        waiting (default: one second's worth of units).
+        """
+        self.rate = rate
+        self.capacity = burst or rate
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        """Consume the units, and block until the rate limit allows it."""
+        if not self.rate:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens += (now - self._last) * self.rate
+            self._tokens = min(self.capacity, self._tokens) - amount
+            self._last = now
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+
+        if wait > 0:
+            time.sleep(wait)
+
+
+class ThrottledReader(object):
+    """Wrapper for readable streams, limiting the throughput in bytes per second."""
+
+    def __init__(self, stream, limiter):
+        """Constructor."""
+        self._stream = stream
+        self._limiter = limiter
+
+    def read(self, size=-1):
+        """Read from the stream, and wait if the rate limit is exceeded."""
+        data = self._stream.read(size)
+        self._limiter.acquire(len(data))
+        return data
+
+
+def probe_database():
+    """Measure the round-trip time of a trivial query to the database."""
+    start = time.monotonic()
+    with db.engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+    return time.monotonic() - start
+
+
+def probe_search():
+    """Measure the round-trip time of a ping to the search cluster."""
+    start = time.monotonic()
+    current_search_client.ping()
+    return time.monotonic() - start
+
+
+class Throttle(object):
+    """Shared throttle for bulk operations, used by all of their workers.
+
+    The throughput is capped in items and bytes per second.
+    Additionally, if a ``max_latency`` (in seconds) is set, the database and
+    search cluster are probed periodically: while their round-trip latency
+    exceeds the threshold, the delay before each item is doubled; otherwise,
+    it is halved again until it vanishes.
+    """
+
+    MAX_DELAY = 60
+    """Upper bound for the adaptive delay (in seconds)."""
+
+    def __init__(
+        self,
+        max_rate=None,
+        max_bytes_rate=None,
+        max_latency=None,
+        probe_interval=1.0,
+        probes=(probe_database, probe_search),
+    ):
+        """Constructor."""
+        self.items = RateLimiter(max_rate)
+        self.bytes = RateLimiter(max_bytes_rate)
+        self.max_latency = max_latency
+        self.probe_interval = probe_interval
+        self.probes = probes
+        self.delay = 0
+        self._last_probe = None
+        self._lock = threading.Lock()
+
+    def _probe(self):
+        """Adjust the delay to the latency, if it is due to be measured again.
+
+        Only one thread probes at a time, the others keep the current delay.
+        """
+        if not self._lock.acquire(blocking=False):
+            return
+
+        try:
+            now = time.monotonic()
+            if self._last_probe is not None:
+                if now - self._last_probe < self.probe_interval:
+                    return
+
+            latency = max(probe() for probe in self.probes)
+            self._last_probe = time.monotonic()
+            if latency > self.max_latency:
+                self.delay = min(self.MAX_DELAY, max(2 * self.delay, latency))
+            elif self.delay < 0.01:
+                self.delay = 0
+            else:
+                self.delay /= 2
+
+        finally:
+            self._lock.release()
+
+    def acquire(self, items=1, num_bytes=0):
+        """Block until the items (and bytes) may be processed."""
+        self.items.acquire(items)
+        self.bytes.acquire(num_bytes)
+        if self.max_latency is not None:
+            self._probe()
+            if self.delay > 0:
+                time.sleep(self.delay)
@@ -8,16 +8,43 @@
 
 """Utilities for the CLI commands."""
 
+import hashlib
 import json
-
+import os
+import shutil
+import uuid as uuid_
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, suppress
+from datetime import datetime
+from itertools import islice
+from os.path import basename
+
+import click
+from flask import current_app
 from flask_principal import Identity
 from invenio_access import any_user
 from invenio_access.utils import get_identity
 from invenio_accounts import current_accounts
 from invenio_db import db
+from invenio_files_rest.errors import FileSizeError
+from invenio_files_rest.models import Bucket, FileInstance, ObjectVersion
 from invenio_pidstore.models import PersistentIdentifier
+from invenio_search import RecordsSearch
+
+from ..utils import get_draft_file_service, get_record_service
+from .metrics import get_metrics
+from .queries import SHARD_HEX_DIGITS, bucket_usage_query, shard_filter, stream_query
+from .throttle import ThrottledReader
+from .workers import WorkerPool
 
-from ..utils import get_record_service
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+FICLONE = 0x40049409
+"""The ``ioctl`` request for creating reflinks on Linux (Btrfs, XFS, ...)."""
 
 
 def read_metadata(metadata_file_path):
@@ -65,6 +92,27 @@ def create_record_from_metadata(
     return draft
 
 
+SYSTEM_FIELDS = (
+    "$schema",
+    "created",
+    "expires_at",
+    "id",
+    "is_published",
+    "links",
+    "parent",
+    "pid",
+    "revision_id",
+    "updated",
+    "versions",
+)
+"""Top-level fields of (stored or serialized) records managed by the system."""
+
+
+def strip_system_fields(record_metadata):
+    """Remove the fields managed by the system from the record's metadata."""
+    return {k: v for k, v in record_metadata.items() if k not in SYSTEM_FIELDS}
+
+
 def patch_metadata(metadata: dict, patch: dict) -> dict:
     """Replace the fields mentioned in the patch, while leaving others as is.
 
@@ -158,3 +206,435 @@ def set_creatibutor_names(record_metadata):
         _set_creatibutor_name(contributor)
 
     return metadata
+
+
+def remove_from_storage(file_storages, max_workers=1, throttle=None):
+    """Remove the files from their storage, using a pool of worker threads.
+
+    The ``file_storages`` are expected to be ``(uri, storage)`` pairs.
+    Yields ``(uri, error)`` pairs as the removals complete, where ``error`` is
+    ``None`` if the file could be removed.
+    """
+    pool = WorkerPool(jobs=max_workers, throttle=throttle, phase="storage")
+    for result in pool.map(lambda item: item[1].delete(), file_storages):
+        yield result.item[0], result.error
+
+
+def _list_directory(path):
+    """List the directory's entries, in the order of their full paths.
+
+    The entries are ``(sort_key, name, is_dir, size, mtime)`` tuples.
+    Directories are sorted as if their names ended with a slash, which makes
+    the depth-first traversal yield the paths in lexicographic order.
+    """
+    entries = []
+    with os.scandir(path) as iterator:
+        for entry in iterator:
+            if entry.is_dir(follow_symlinks=False):
+                entries.append((entry.name + "/", entry.name, True, 0, 0))
+            elif entry.is_file(follow_symlinks=False):
+                stat = entry.stat(follow_symlinks=False)
+                entries.append(
+                    (entry.name, entry.name, False, stat.st_size, stat.st_mtime)
+                )
+
+    entries.sort()
+    return entries
+
+
+def walk_files_sorted(root, max_workers=1, include=None):
+    """Yield ``(path, size, mtime)`` for all files under root, sorted by path.
+
+    The directory listings are fetched in parallel by a pool of worker threads:
+    the listings of all sub-directories are requested as soon as their parent
+    directory has been listed, and only consumed when the traversal gets there.
+    Thus, memory usage is bounded by the width of the directory tree along the
+    current path rather than by the total number of files.
+    If ``include`` is set, only the top-level entries whose names it accepts
+    are traversed.
+    """
+
+    def walk(path, listing, executor):
+        futures = {
+            name: executor.submit(_list_directory, os.path.join(path, name))
+            for _, name, is_dir, _, _ in listing
+            if is_dir
+        }
+        for _, name, is_dir, size, mtime in listing:
+            if is_dir:
+                sub_path = os.path.join(path, name)
+                yield from walk(sub_path, futures.pop(name).result(), executor)
+            else:
+                yield os.path.join(path, name), size, mtime
+
+    listing = _list_directory(root)
+    if include is not None:
+        listing = [entry for entry in listing if include(entry[1])]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        yield from walk(root, listing, executor)
+
+
+def get_usage_cache_path():
+    """Get the path of the file for caching the storage usage per bucket."""
+    path = current_app.config.get("UTILITIES_TUW_USAGE_CACHE_PATH")
+    return path or os.path.join(current_app.instance_path, "storage-usage.json")
+
+
+def load_usage_cache(path):
+    """Load the cached storage usage per bucket, or an empty cache."""
+    if not os.path.isfile(path):
+        return {"refreshed": None, "buckets": {}}
+
+    with open(path, "r") as cache_file:
+        return json.load(cache_file)
+
+
+def save_usage_cache(path, cache):
+    """Atomically replace the storage usage cache file."""
+    tmp_path = "{}.tmp".format(path)
+    with open(tmp_path, "w") as cache_file:
+        json.dump(cache, cache_file)
+
+    os.replace(tmp_path, path)
+
+
+def touch_buckets(bucket_ids):
+    """Update the buckets' timestamps, after changing their objects in bulk.
+
+    This way, the buckets are picked up by the next incremental refresh of the
+    storage usage cache.
+    """
+    bucket_ids = list(bucket_ids)
+    if bucket_ids:
+        Bucket.query.filter(Bucket.id.in_(bucket_ids)).update(
+            {Bucket.updated: datetime.utcnow()}, synchronize_session=False
+        )
+
+
+def refresh_usage_cache(cache, full=False, chunk_size=1000):
+    """Update the cached storage usage of buckets changed since the last refresh.
+
+    Since the bucket's timestamp is updated whenever its contents change (via
+    ``touch_buckets`` for changes that bypass the ORM), only these buckets have
+    to be aggregated again.
+    Deleted buckets are removed from the cache.
+    """
+    refreshed = datetime.utcnow()
+    since = cache["refreshed"] if not full else None
+    if since is not None:
+        since = datetime.strptime(since, "%Y-%m-%dT%H:%M:%S.%f")
+
+    buckets = {} if full else cache["buckets"]
+    for bucket_id, num_files, num_bytes in stream_query(
+        bucket_usage_query(updated_since=since), chunk_size
+    ):
+        buckets[str(bucket_id)] = [num_files, int(num_bytes)]
+
+    if not full:
+        existing = stream_query(db.session.query(Bucket.id), chunk_size)
+        existing = {str(bucket_id) for (bucket_id,) in existing}
+        for bucket_id in set(buckets) - existing:
+            del buckets[bucket_id]
+
+    cache["refreshed"] = refreshed.strftime("%Y-%m-%dT%H:%M:%S.%f")
+    cache["buckets"] = buckets
+    return cache
+
+
+class HashingReader(object):
+    """Wrapper for readable streams, computing the checksum of the read data."""
+
+    def __init__(self, stream, algorithm="md5"):
+        """Constructor."""
+        self._stream = stream
+        self._algorithm = algorithm
+        self._hash = hashlib.new(algorithm)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        """Read from the stream, and update the checksum."""
+        data = self._stream.read(size)
+        self._hash.update(data)
+        self.bytes_read += len(data)
+        return data
+
+    @property
+    def checksum(self):
+        """The checksum of the data read so far, in the format of Invenio-Files."""
+        return "{}:{}".format(self._algorithm, self._hash.hexdigest())
+
+
+def copy_file_contents(source, target, size=None, checksum=None, limiter=None):
+    """Copy the file's contents from the source storage to the target storage.
+
+    The checksum is computed during the copy, with the algorithm of the expected
+    ``checksum`` (if any).
+    Returns the target's URI, the number of copied bytes, and the checksum.
+    """
+    algorithm = checksum.split(":", 1)[0] if checksum else "md5"
+    with source.open() as stream:
+        reader = HashingReader(stream, algorithm)
+        stream = ThrottledReader(reader, limiter) if limiter else reader
+        uri, _, _ = target.save(stream, size=size)
+
+    return uri, reader.bytes_read, reader.checksum
+
+
+def get_local_path(uri):
+    """Get the local file system path for the URI, or ``None`` if it's remote."""
+    path = uri[len("file://") :] if uri.startswith("file://") else uri
+    return path if "://" not in path else None
+
+
+def link_or_copy_file(source_path, target_path):
+    """Create the target as a reflink or hardlink of the source, or copy it.
+
+    Reflinks are preferred over hardlinks, because they don't let changes to the
+    source file propagate into the storage.
+    Returns the used method: ``"reflink"``, ``"hardlink"`` or ``"copy"``.
+    """
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    if fcntl is not None:
+        try:
+            with open(source_path, "rb") as source, open(target_path, "wb") as target:
+                fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+            return "reflink"
+        except OSError:
+            with suppress(FileNotFoundError):
+                os.remove(target_path)
+
+    try:
+        os.link(source_path, target_path)
+        return "hardlink"
+    except OSError:
+        pass
+
+    shutil.copyfile(source_path, target_path)
+    return "copy"
+
+
+def link_file_content(draft, file_key, file_path, chunk_size=1024 * 1024):
+    """Add the local file to the draft's bucket, without streaming it to storage.
+
+    The file is linked into the storage location if possible (see
+    ``link_or_copy_file``); its checksum and size are still recorded, and its
+    size is checked against the bucket's quota and size limit.
+    The bucket's size is updated when the file is set on the object version.
+    The changes are committed along with the file (via ``commit_file``).
+    Returns the used method, or ``None`` if the draft's storage location is not
+    a local directory.
+    """
+    bucket = draft.files.bucket
+    if get_local_path(bucket.location.uri) is None:
+        return None
+
+    with open(file_path, "rb") as source:
+        reader = HashingReader(source)
+        while reader.read(chunk_size):
+            pass
+
+    # check the quota and size limit like the upload via the REST API
+    size_limit = bucket.size_limit
+    if size_limit is not None and reader.bytes_read > size_limit:
+        raise FileSizeError(description="file size limit exceeded: %s" % file_path)
+
+    fi = FileInstance.create()
+    storage = fi.storage(
+        default_location=bucket.location.uri,
+        default_storage_class=bucket.default_storage_class,
+    )
+    uri = storage.fileurl
+    target_path = get_local_path(uri)
+
+    method = link_or_copy_file(file_path, target_path)
+    fi.set_uri(
+        uri,
+        reader.bytes_read,
+        reader.checksum,
+        storage_class=bucket.default_storage_class,
+    )
+    ObjectVersion.create(bucket, file_key, _file_id=fi.id)
+    return method
+
+
+def deposit_files(recid, identity, file_paths, link=False):
+    """Add the local files to the draft, named after their base names.
+
+    In the ``link`` mode, the files are linked into storage if possible rather
+    than streamed through the service.
+    """
+    service = get_draft_file_service()
+    service.init_files(
+        id_=recid,
+        identity=identity,
+        data=[{"key": basename(fp)} for fp in file_paths],
+    )
+
+    draft = None
+    if link:
+        draft = get_record_service().read_draft(id_=recid, identity=identity)._record
+        service.require_permission(identity, "create_files", record=draft)
+
+    for fp in file_paths:
+        fn = basename(fp)
+        if draft is None or link_file_content(draft, fn, fp) is None:
+            with open(fp, "rb") as deposit_file:
+                service.set_file_content(
+                    id_=recid, file_key=fn, identity=identity, stream=deposit_file
+                )
+
+        service.commit_file(id_=recid, file_key=fn, identity=identity)
+
+
+def iter_batches(iterable, batch_size):
+    """Split the iterable into lists of up to ``batch_size`` items."""
+    iterator = iter(iterable)
+    batch = list(islice(iterator, batch_size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, batch_size))
+
+
+def bulk_index_records(indexer, record_ids):
+    """Index the records via the indexer's bulk queue, and process it right away."""
+    record_ids = [str(record_id) for record_id in record_ids]
+    if record_ids:
+        with get_metrics().phase("indexing", items=len(record_ids)):
+            indexer.bulk_index(record_ids)
+            indexer.process_bulk_queue()
+
+
+class DeferredIndexer(object):
+    """Proxy for an indexer, which defers the indexing of records.
+
+    Records that are deleted from the index before the deferred indexing is
+    performed are simply forgotten about.
+    """
+
+    def __init__(self, indexer):
+        """Constructor."""
+        self.indexer = indexer
+        self.pending = {}
+
+    def __getattr__(self, name):
+        """Delegate everything else to the wrapped indexer."""
+        return getattr(self.indexer, name)
+
+    def index(self, record, *args, **kwargs):
+        """Remember the record for later indexing."""
+        self.pending[(type(record), str(record.id))] = record
+
+    def delete(self, record, *args, **kwargs):
+        """Delete the record from the index, or forget about indexing it."""
+        if self.pending.pop((type(record), str(record.id)), None) is None:
+            return self.indexer.delete(record, *args, **kwargs)
+
+    def flush(self):
+        """Index the pending records, in bulk where possible."""
+        record_cls = self.indexer.record_cls
+        bulk_ids = [
+            record.id for record in self.pending.values() if type(record) is record_cls
+        ]
+        for record in self.pending.values():
+            if type(record) is not record_cls:
+                self.indexer.index(record)
+
+        bulk_index_records(self.indexer, bulk_ids)
+        self.pending = {}
+
+
+@contextmanager
+def deferred_indexing(service):
+    """Temporarily defer the service's indexing, until ``flush()`` is called.
+
+    The service creates a new indexer from its config on each access, so the
+    config is temporarily replaced with one that hands out the deferred indexer.
+    """
+    config = service.config
+    deferred = DeferredIndexer(service.indexer)
+
+    def indexer_cls(*args, **kwargs):
+        return deferred
+
+    service.config = type(
+        config.__name__, (config,), {"indexer_cls": staticmethod(indexer_cls)}
+    )
+    try:
+        yield deferred
+    finally:
+        service.config = config
+
+
+def search_records(query, record_cls, page_size=1000):
+    """Lazily yield ``(uuid, recid)`` for the records matching the search query.
+
+    The results are fetched page by page via the search engine's scroll API,
+    without any permission checks.
+    """
+    search = (
+        RecordsSearch(index=record_cls.index.search_alias)
+        .query("query_string", query=query)
+        .source(["id"])
+        .params(size=page_size)
+    )
+    for hit in search.scan():
+        yield hit.meta.id, hit.id
+
+
+def in_shard(value, shard):
+    """Check if the value (a UUID or string) belongs to the shard, in Python.
+
+    The ``shard`` is an ``(index, num_shards)`` tuple, or ``None``.
+    UUIDs are partitioned in the same way as by ``shard_filter`` in SQL.
+    """
+    if shard is None:
+        return True
+
+    index, num_shards = shard
+    if isinstance(value, uuid_.UUID):
+        return value.int % 16**SHARD_HEX_DIGITS % num_shards == index
+
+    return zlib.crc32(str(value).encode("utf-8")) % num_shards == index
+
+
+def iter_selected_records(
+    pids=None,
+    pid_type="recid",
+    query=None,
+    record_cls=None,
+    chunk_size=1000,
+    shard=None,
+):
+    """Lazily yield ``(uuid, recid)`` for the selected records.
+
+    The records can be selected via their PIDs, or via a search query.
+    If neither are specified, all (non-deleted) records are selected.
+    With a ``shard``, only the records in the given partition are selected.
+    """
+    if pids and query:
+        raise click.UsageError("--pid and --query cannot be combined")
+
+    record_cls = record_cls or get_record_service().record_cls
+    if pids or query:
+        if pids:
+            selected = (
+                (get_object_uuid(pid, pid_type), convert_to_recid(pid, pid_type))
+                for pid in pids
+            )
+        else:
+            selected = search_records(query, record_cls, page_size=chunk_size)
+
+        for uuid, recid in selected:
+            if in_shard(uuid_.UUID(str(uuid)), shard):
+                yield uuid, recid
+
+    else:
+        model_cls = record_cls.model_cls
+        rows = db.session.query(model_cls.id, model_cls.json["id"])
+        if shard is not None:
+            rows = rows.filter(shard_filter(model_cls.id, shard))
+
+        for uuid, recid in stream_query(rows, chunk_size):
+            if recid is not None:
+                yield uuid, recid
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Execution of bulk operations in a pool of worker threads.
+
+Each work item is processed in a fresh application context in one of the
+worker threads, and thus with its own database session.
+Consequently, the work items themselves should be plain values (like IDs)
+rather than database objects that are bound to the caller's session.
+"""
+
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import click
+from flask import current_app
+from invenio_db import db
+
+from .metrics import get_metrics
+
+
+def map_ordered(executor, fn, iterable, window):
+    """Like ``executor.map()``, but with at most ``window`` pending tasks.
+
+    In contrast to ``executor.map()``, the iterable is consumed lazily, which
+    keeps the memory usage bounded for large (or endless) iterables.
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+
+    while pending:
+        yield pending.popleft().result()
+
+
+WorkResult = namedtuple("WorkResult", ["item", "value", "error"])
+"""The outcome of processing a single work item.
+
+Either the ``value`` returned for the item, or the ``error`` that was raised.
+"""
+
+
+class WorkSummary(object):
+    """Counters for the items processed by a worker pool."""
+
+    def __init__(self):
+        """Constructor."""
+        self.num_items = 0
+        self.num_errors = 0
+        self.start_time = time.monotonic()
+
+    @property
+    def num_succeeded(self):
+        """The number of items that were processed without errors."""
+        return self.num_items - self.num_errors
+
+    @property
+    def elapsed(self):
+        """The number of seconds since the summary was started."""
+        return time.monotonic() - self.start_time
+
+    def add(self, result):
+        """Count the result."""
+        self.num_items += 1
+        if result.error is not None:
+            self.num_errors += 1
+
+    def echo(self, noun="items"):
+        """Print the summary to stderr."""
+        click.secho(
+            "processed {} {} in {:.1f}s, {} errors".format(
+                self.num_items, noun, self.elapsed, self.num_errors
+            ),
+            fg="yellow" if self.num_errors else "green",
+            err=True,
+        )
+
+
+class WorkerPool(object):
+    """Pool of worker threads for processing work items in parallel.
+
+    The work items are consumed lazily, with at most ``window`` items being
+    in flight at any time (default: two per worker), and the results are
+    yielded in the order of the work items.
+    Exceptions raised for an item are captured in its result rather than
+    aborting the whole operation.
+    If a ``throttle`` is given, each worker waits for it before processing
+    the next item.
+    The processing time of the items is recorded in the metrics for the
+    given ``phase`` of the command.
+    """
+
+    def __init__(self, jobs=1, window=None, throttle=None, phase="service"):
+        """Constructor."""
+        self.jobs = jobs
+        self.window = window or 2 * jobs
+        self.throttle = throttle
+        self.phase = phase
+        self.metrics = get_metrics()
+        self.summary = WorkSummary()
+        self._app = current_app._get_current_object()
+
+    def _process(self, fn, item):
+        """Process the item in a fresh application context.
+
+        The database session is committed if the item was processed
+        successfully, and rolled back otherwise.
+        """
+        with self._app.app_context():
+            start = time.monotonic()
+            try:
+                if self.throttle is not None:
+                    self.throttle.acquire()
+
+                value = fn(item)
+                db.session.commit()
+                result = WorkResult(item, value, None)
+
+            except Exception as error:
+                db.session.rollback()
+                result = WorkResult(item, None, error)
+
+        elapsed = time.monotonic() - start
+        self.metrics.add(
+            self.phase, elapsed, 1, 1, errors=int(result.error is not None)
+        )
+        return result
+
+    def map(self, fn, items):
+        """Apply ``fn`` to each of the items, and yield ``WorkResult`` tuples."""
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            process = partial(self._process, fn)
+            for result in map_ordered(executor, process, items, self.window):
+                self.summary.add(result)
+                yield result
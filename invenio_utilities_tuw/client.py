@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Thin client for the CLI daemon (``tuw serve-cli``).
+
+The client forwards its arguments to the daemon via a Unix socket, and
+streams the command's output back to stdout and stderr.
+It only depends on the standard library, so it starts up quickly::
+
+    tuw-client records list
+
+The protocol consists of a single JSON line with the request, followed by
+frames from the daemon, each with a header (kind and payload length) and the
+payload.
+The kind is ``o`` for stdout, ``e`` for stderr and ``x`` for the exit code,
+which is the last frame.
+"""
+
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+
+ENV_PREFIX = "INVENIO_UTILITIES_TUW_"
+"""Prefix of the environment variables that are forwarded to the daemon."""
+
+SOCKET_ENVVAR = ENV_PREFIX + "SOCKET"
+"""Environment variable for the path of the daemon's socket."""
+
+FRAME_HEADER = struct.Struct("!cI")
+"""Header of the frames sent by the daemon: kind and payload length."""
+
+
+def get_default_socket_path():
+    """Get the default path of the daemon's socket, private to the current user."""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "invenio-utilities-tuw.sock")
+
+    name = "invenio-utilities-tuw-{}.sock".format(os.getuid())
+    return os.path.join(tempfile.gettempdir(), name)
+
+
+def main(argv=None):
+    """Run a command via the daemon, and return its exit code."""
+    argv = sys.argv[1:] if argv is None else argv
+    socket_path = os.environ.get(SOCKET_ENVVAR) or get_default_socket_path()
+    request = {
+        "argv": argv,
+        "cwd": os.getcwd(),
+        "env": {k: v for k, v in os.environ.items() if k.startswith(ENV_PREFIX)},
+        "color": sys.stdout.isatty(),
+    }
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError as error:
+        msg = "cannot connect to 'tuw serve-cli' at {}: {}\n"
+        sys.stderr.write(msg.format(socket_path, error))
+        return 1
+
+    with sock, sock.makefile("rb") as frames:
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        while True:
+            header = frames.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                sys.stderr.write("connection to the daemon was closed\n")
+                return 1
+
+            kind, length = FRAME_HEADER.unpack(header)
+            payload = frames.read(length)
+            if kind == b"x":
+                return int(payload)
+
+            output = sys.stdout.buffer if kind == b"o" else sys.stderr.buffer
+            output.write(payload)
+            output.flush()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
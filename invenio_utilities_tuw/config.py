@@ -8,20 +8,40 @@
 
 """Some utilities for InvenioRDM."""
 
-from invenio_rdm_records.proxies import current_rdm_records
+
+def _get_rdm_records_service(name):
+    """Get the named service from Invenio-RDM-Records, importing it lazily."""
+    from invenio_rdm_records.proxies import current_rdm_records
+
+    return getattr(current_rdm_records, name)
+
 
 UTILITIES_TUW_BASE_TEMPLATE = "invenio_utilities_tuw/base.html"
 """Default base template for the demo page."""
 
-UTILITIES_TUW_RECORD_SERVICE_FACTORY = lambda: current_rdm_records.records_service
-"""Factory function for creating a RecordService."""
+UTILITIES_TUW_RECORD_SERVICE_FACTORY = lambda: _get_rdm_records_service(
+    "records_service"
+)
+"""Factory function (or its import path) for creating a RecordService."""
 
-UTILITIES_TUW_RECORD_FILES_SERVICE_FACTORY = (
-    lambda: current_rdm_records.record_files_service
+UTILITIES_TUW_RECORD_FILES_SERVICE_FACTORY = lambda: _get_rdm_records_service(
+    "record_files_service"
 )
-"""Factory function for creating a RecordFileService."""
+"""Factory function (or its import path) for creating a RecordFileService."""
 
-UTILITIES_TUW_DRAFT_FILES_SERVICE_FACTORY = (
-    lambda: current_rdm_records.draft_files_service
+UTILITIES_TUW_DRAFT_FILES_SERVICE_FACTORY = lambda: _get_rdm_records_service(
+    "draft_files_service"
 )
-"""Factory function for creating a DraftFileService."""
+"""Factory function (or its import path) for creating a DraftFileService."""
+
+UTILITIES_TUW_USAGE_CACHE_PATH = None
+"""Path of the file for caching storage usage statistics per bucket.
+
+If not set, the file ``storage-usage.json`` in the instance path will be used.
+"""
+
+UTILITIES_TUW_JOB_JOURNAL_PATH = None
+"""Path of the SQLite database for the journal of resumable bulk operations.
+
+If not set, the file ``jobs.sqlite3`` in the instance path will be used.
+"""
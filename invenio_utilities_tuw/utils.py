@@ -9,10 +9,16 @@
 """Utility functions for Invenio-Utilities-TUW."""
 
 
+from weakref import WeakKeyDictionary
+
 from flask import current_app
-from invenio_rdm_records.proxies import current_rdm_records
 from werkzeug.utils import import_string
 
+from . import config
+
+_service_cache = WeakKeyDictionary()
+"""Cached services per application, with the factories they were created by."""
+
 
 def get_or_import(value, default=None):
     """Try an import if value is an endpoint string, or return value itself."""
@@ -24,28 +30,41 @@ def get_or_import(value, default=None):
     return default
 
 
+def _get_service(config_key):
+    """Get the service from the factory configured under the key.
+
+    The factory may also be given as an import path.
+    The service is cached per application, until the configured factory changes.
+    """
+    app = current_app._get_current_object()
+    factory = app.config.get(config_key, getattr(config, config_key))
+    cache = _service_cache.setdefault(app, {})
+    cached = cache.get(config_key)
+    if cached is None or cached[0] != factory:
+        cached = (factory, get_or_import(factory)())
+        cache[config_key] = cached
+
+    return cached[1]
+
+
+def clear_service_cache(app=None):
+    """Clear the cached services for the application (default: all)."""
+    if app is None:
+        _service_cache.clear()
+    else:
+        _service_cache.pop(app, None)
+
+
 def get_record_service():
     """Get the configured RecordService."""
-    factory = current_app.config.get(
-        "UTILITIES_TUW_RECORD_SERVICE_FACTORY",
-        lambda: current_rdm_records.records_service,
-    )
-    return factory()
+    return _get_service("UTILITIES_TUW_RECORD_SERVICE_FACTORY")
 
 
 def get_record_file_service():
     """Get the configured RecordFileService."""
-    factory = current_app.config.get(
-        "UTILITIES_TUW_RECORD_FILES_SERVICE_FACTORY",
-        lambda: current_rdm_records.record_files_service,
-    )
-    return factory()
+    return _get_service("UTILITIES_TUW_RECORD_FILES_SERVICE_FACTORY")
 
 
 def get_draft_file_service():
     """Get the configured DraftFilesService."""
-    factory = current_app.config.get(
-        "UTILITIES_TUW_DRAFT_FILES_SERVICE_FACTORY",
-        lambda: current_rdm_records.draft_files_service,
-    )
-    return factory()
+    return _get_service("UTILITIES_TUW_DRAFT_FILES_SERVICE_FACTORY")
@@ -16,13 +16,22 @@ readme = open("README.rst").read()
 history = open("CHANGES.rst").read()
 
 tests_require = [
+    "invenio-app>=1.3.0",
     "pytest-invenio>=1.4.0",
 ]
 
 extras_require = {
+    "benchmarks": [
+        "pytest-benchmark>=3.2.0",
+        *tests_require,
+    ],
     "docs": [
         "Sphinx>=3,<4",
     ],
+    "export": [
+        "orjson>=3.4.0",
+        "zstandard>=0.15.0",
+    ],
     "tests": tests_require,
 }
 
@@ -67,6 +76,7 @@ setup(
     include_package_data=True,
     platforms="any",
     entry_points={
+        "console_scripts": ["tuw-client = invenio_utilities_tuw.client:main"],
         "flask.commands": ["tuw = invenio_utilities_tuw.cli:utilities"],
         "invenio_base.apps": [
             "invenio_utilities_tuw = invenio_utilities_tuw:InvenioUtilitiesTUW",
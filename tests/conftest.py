@@ -14,12 +14,21 @@ fixtures are available.
 
 import shutil
 import tempfile
+from types import SimpleNamespace
 
 import pytest
 from flask import Flask
 from flask_babelex import Babel
+from invenio_access.models import ActionUsers
+from invenio_access.permissions import superuser_access
+from invenio_accounts import current_accounts
+from invenio_files_rest.models import Location
+from invenio_rdm_records.services.config import RDMRecordServiceConfig
+from invenio_rdm_records.services.permissions import RDMRecordPermissionPolicy
+from invenio_records_permissions.generators import SystemProcess
 
 from invenio_utilities_tuw import InvenioUtilitiesTUW
+from invenio_utilities_tuw.cli import workers
 from invenio_utilities_tuw.views import blueprint
 
 
@@ -45,3 +54,46 @@ def create_app(instance_path):
         return app
 
     return factory
+
+
+class PermissionPolicy(RDMRecordPermissionPolicy):
+    """Permission policy that lets admins delete records, like in production."""
+
+    can_delete = [SystemProcess()]
+
+
+class RecordServiceConfig(RDMRecordServiceConfig):
+    """Record service config with the above permission policy."""
+
+    permission_policy_cls = PermissionPolicy
+
+
+@pytest.fixture(scope="module")
+def app_config(app_config):
+    """Override pytest-invenio fixture, to let admins delete records and files."""
+    app_config["RDM_RECORDS_BIBLIOGRAPHIC_SERVICE_CONFIG"] = RecordServiceConfig
+    return app_config
+
+
+@pytest.fixture()
+def counting_session(monkeypatch):
+    """Database session that counts the commits and rollbacks."""
+    session = SimpleNamespace(commits=0, rollbacks=0)
+    session.commit = lambda: setattr(session, "commits", session.commits + 1)
+    session.rollback = lambda: setattr(session, "rollbacks", session.rollbacks + 1)
+    monkeypatch.setattr(workers, "db", SimpleNamespace(session=session))
+    return session
+
+
+@pytest.fixture(scope="module")
+def admin(database, tmp_path_factory):
+    """User with superuser access, and a default storage location."""
+    storage_path = tmp_path_factory.mktemp("storage")
+    location = Location(name="test", uri=str(storage_path), default=True)
+    database.session.add(location)
+    user = current_accounts.datastore.create_user(
+        email="admin@example.org", password=None, active=True
+    )
+    database.session.add(ActionUsers.allow(superuser_access, user=user))
+    database.session.commit()
+    return user
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Tests for the lazy loading of the CLI commands."""
+
+import click
+from click.testing import CliRunner
+
+from invenio_utilities_tuw.cli.cli import LazyGroup
+
+
+def test_lazy_group():
+    """Test that sub-commands are only imported when they are needed."""
+    group = LazyGroup(
+        "group",
+        lazy_commands={
+            "users": ("invenio_utilities_tuw.cli.users:users", "Stored help."),
+        },
+    )
+
+    result = CliRunner().invoke(group, ["--help"])
+    assert result.exit_code == 0
+    assert "Stored help." in result.output
+    assert "users" not in group.commands
+
+    command = group.get_command(click.Context(group), "users")
+    assert command.name == "users"
+    assert group.commands["users"] is command
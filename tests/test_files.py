@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Tests for the file commands."""
+
+import os
+from io import BytesIO
+
+import pytest
+from invenio_app.factory import create_api
+from invenio_files_rest.models import FileInstance, Location
+
+from invenio_utilities_tuw.cli import utilities
+
+create_app = create_api
+"""Create the full InvenioRDM (API) application."""
+
+
+@pytest.fixture()
+def unreferenced_files(database, admin):
+    """Files in the default location, which aren't used by any object."""
+    location = Location.get_default()
+    files = []
+    for i in range(3):
+        fi = FileInstance.create()
+        fi.set_contents(BytesIO(b"file %d" % i), default_location=location.uri)
+        files.append(fi)
+
+    database.session.commit()
+    return [(fi.id, fi.uri) for fi in files]
+
+
+def test_clean_orphans_in_chunks(base_app, admin, unreferenced_files):
+    """Test removing unreferenced files over several committed chunks."""
+    runner = base_app.test_cli_runner()
+    result = runner.invoke(
+        utilities,
+        ["files", "orphans", "clean", "--yes", "--chunk-size", "1"]
+        + ["--as-user", admin.email],
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0, result.output
+
+    assert FileInstance.query.count() == 0
+    for _, uri in unreferenced_files:
+        assert not os.path.exists(uri)
+
+
+def test_migrate_in_chunks(base_app, database, admin, unreferenced_files, tmp_path):
+    """Test moving files to another location over several committed chunks."""
+    archive = Location(name="archive", uri=str(tmp_path / "archive"))
+    database.session.add(archive)
+    database.session.commit()
+    archive_uri = archive.uri
+
+    runner = base_app.test_cli_runner()
+    result = runner.invoke(
+        utilities,
+        ["files", "migrate", "--to", "archive", "--yes", "--chunk-size", "1"],
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0, result.output
+
+    for file_id, old_uri in unreferenced_files:
+        fi = FileInstance.query.get(file_id)
+        assert fi.uri.startswith(archive_uri + "/")
+        assert os.path.exists(fi.uri)
+        assert not os.path.exists(old_uri)
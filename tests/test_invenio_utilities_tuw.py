@@ -31,3 +31,18 @@ def test_init():
     assert "invenio-utilities-tuw" not in app.extensions
     ext.init_app(app)
     assert "invenio-utilities-tuw" in app.extensions
+
+
+def test_service_cache():
+    """Test that the services are cached until the configured factory changes."""
+    from invenio_utilities_tuw.utils import get_record_service
+
+    app = Flask("testapp")
+    app.config["UTILITIES_TUW_RECORD_SERVICE_FACTORY"] = "collections:OrderedDict"
+    with app.app_context():
+        service = get_record_service()
+        assert type(service).__name__ == "OrderedDict"
+        assert get_record_service() is service
+
+        app.config["UTILITIES_TUW_RECORD_SERVICE_FACTORY"] = dict
+        assert type(get_record_service()) is dict
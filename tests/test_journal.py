@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Tests for the job journal."""
+
+import click
+import pytest
+
+from invenio_utilities_tuw.cli.journal import JobJournal, filter_pending
+
+
+def test_resume_skips_completed_items(tmp_path):
+    """Test that a resumed job only yields the pending items."""
+    path = str(tmp_path / "jobs.sqlite3")
+    journal = JobJournal(path, "job-1", "tuw records reindex")
+    keys = journal.select(lambda: ["a", "b", "c", "d"])
+    assert next(keys) == "a"
+    journal.mark("a")
+    journal.mark("b", error=ValueError("oops"))
+    journal.close()
+
+    with pytest.raises(click.UsageError):
+        JobJournal(path, "job-1", "tuw records reindex")
+    with pytest.raises(click.UsageError):
+        JobJournal(path, "job-1", "tuw records delete", resume=True)
+
+    journal = JobJournal(path, "job-1", "tuw records reindex", resume=True)
+    assert list(journal.select(lambda: [])) == ["b", "c", "d"]
+    journal.close()
+
+
+def test_filter_pending():
+    """Test filtering items in work set order."""
+    items = [(1, "x"), (2, "y"), (3, "z")]
+    pending = filter_pending(items, ["1", "3"], key=lambda item: str(item[0]))
+    assert list(pending) == [(1, "x"), (3, "z")]
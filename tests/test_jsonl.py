@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Tests for the JSON Lines utilities."""
+
+from invenio_utilities_tuw.cli.jsonl import (
+    compress,
+    dumps_lines,
+    get_shard_paths,
+    iter_documents,
+)
+
+
+def test_compressed_blocks_roundtrip(tmp_path):
+    """Test reading a file consisting of several compressed blocks."""
+    path = str(tmp_path / "records.jsonl.gz")
+    batches = [[{"id": "abcd-1234"}, {"id": "efgh-5678"}], [{"id": "ijkl-9012"}]]
+    with open(path, "wb") as output:
+        for batch in batches:
+            output.write(compress(dumps_lines(batch), "gzip"))
+
+    assert list(iter_documents(path)) == batches[0] + batches[1]
+
+
+def test_shard_paths():
+    """Test the naming of output shards."""
+    assert get_shard_paths("out/records.jsonl.zst", 1) == ["out/records.jsonl.zst"]
+    assert get_shard_paths("out/records.jsonl.zst", 2) == [
+        "out/records-000.jsonl.zst",
+        "out/records-001.jsonl.zst",
+    ]
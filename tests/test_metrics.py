@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Tests for the performance metrics of the commands."""
+
+import json
+
+import click
+from click.testing import CliRunner
+
+from invenio_utilities_tuw.cli import utilities
+from invenio_utilities_tuw.cli.metrics import get_metrics
+
+
+@click.group()
+def sample():
+    """Sample group."""
+
+
+@sample.command("run")
+@click.option("--items", type=int, default=1)
+def run(items):
+    """Sample command, which records some metrics."""
+    get_metrics().add("service", 0.5, 1, items)
+
+
+def test_metrics_export(monkeypatch, tmp_path):
+    """Test that the exported metrics are labelled with the invoked command."""
+    monkeypatch.setitem(utilities.commands, "sample", sample)
+    json_path, textfile_path = tmp_path / "metrics.json", tmp_path / "metrics.prom"
+    result = CliRunner().invoke(
+        utilities,
+        ["--metrics-json", str(json_path), "--metrics-textfile", str(textfile_path)]
+        + ["sample", "run", "--items", "3"],
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0, result.output
+
+    data = json.loads(json_path.read_text())
+    assert data["command"] == "sample run"
+    assert data["exit_code"] == 0
+    assert data["phases"]["service"]["items"] == 3
+
+    textfile = textfile_path.read_text()
+    assert 'tuw_command_exit_code{command="sample run"} 0' in textfile
+    assert 'tuw_phase_items{command="sample run",phase="service"} 3' in textfile
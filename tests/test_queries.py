@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Tests for the database queries."""
+
+from sqlalchemy import Column, Integer, create_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session
+
+from invenio_utilities_tuw.cli.queries import iter_chunks
+
+Base = declarative_base()
+
+
+class Item(Base):
+    """Minimal model for paginating over."""
+
+    __tablename__ = "items"
+    id = Column(Integer, primary_key=True)
+
+
+def test_iter_chunks_with_commits():
+    """Test that the session can be committed and cleared between the chunks."""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    session.add_all([Item(id=i) for i in range(5)])
+    session.commit()
+
+    ids = []
+    for chunk in iter_chunks(session.query(Item), Item.id, chunk_size=2):
+        ids.extend(item.id for item in chunk)
+        session.commit()
+        session.expunge_all()
+
+    assert ids == [0, 1, 2, 3, 4]
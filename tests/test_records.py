@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Tests for the record commands."""
+
+import json
+
+from invenio_app.factory import create_api
+from invenio_files_rest.models import Location
+
+from invenio_utilities_tuw.cli import utilities
+from invenio_utilities_tuw.cli.seed import RepositorySeeder
+from invenio_utilities_tuw.cli.utils import deferred_indexing, get_identity_for_user
+from invenio_utilities_tuw.utils import get_record_service
+
+create_app = create_api
+"""Create the full InvenioRDM (API) application."""
+
+
+class FakeIndexer(object):
+    """Indexer that remembers the indexed records."""
+
+    indexed = []
+
+    def __init__(self, record_cls=None, **kwargs):
+        """Constructor."""
+        self.record_cls = record_cls
+
+    def index(self, record):
+        """Remember the record as indexed."""
+        self.indexed.append(record)
+
+    def bulk_index(self, record_ids):
+        """Remember the records as indexed."""
+        self.indexed.extend(record_ids)
+
+    def process_bulk_queue(self):
+        """Nothing to do."""
+
+
+class FakeConfig(object):
+    """Service config with the fake indexer."""
+
+    indexer_cls = FakeIndexer
+    record_cls = dict
+
+
+class FakeService(object):
+    """Service that creates a new indexer on each access, like RecordService."""
+
+    def __init__(self, config):
+        """Constructor."""
+        self.config = config
+
+    @property
+    def indexer(self):
+        """Create a new indexer from the config."""
+        return self.config.indexer_cls(record_cls=self.config.record_cls)
+
+
+def test_deferred_indexing():
+    """Test that indexing is deferred, even though the indexer is a property."""
+    service = FakeService(FakeConfig)
+    record = type("Record", (object,), {"id": "abcde-12345"})()
+    FakeIndexer.indexed = []
+    with deferred_indexing(service) as indexer:
+        service.indexer.index(record)
+        assert FakeIndexer.indexed == []
+        indexer.flush()
+
+    assert FakeIndexer.indexed == [record]
+    assert service.config is FakeConfig
+
+
+def test_import_records(app, es_clear, admin, tmp_path):
+    """Test that the imported records are published and indexed."""
+    document = {
+        "access": {"record": "public", "files": "public"},
+        "metadata": {
+            "title": "Imported record",
+            "publication_date": "2021-01-01",
+            "resource_type": {"type": "image", "subtype": "image-photo"},
+            "creators": [
+                {
+                    "person_or_org": {
+                        "type": "personal",
+                        "given_name": "Given",
+                        "family_name": "Family",
+                    }
+                }
+            ],
+        },
+    }
+    input_path = tmp_path / "records.jsonl"
+    input_path.write_text("\n".join(json.dumps(document) for _ in range(3)) + "\n")
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(
+        utilities,
+        ["records", "import", str(input_path), "--as-user", admin.email],
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0, result.output
+
+    service = get_record_service()
+    service.record_cls.index.refresh()
+    assert service.record_cls.model_cls.query.count() == 3
+    assert service.search(identity=get_identity_for_user(admin.email)).total == 3
+
+
+def test_list_records(base_app, admin):
+    """Test that the records listed by the worker threads can be printed."""
+    seeder = RepositorySeeder(Location.get_default(), max_files=0, seed=2)
+    seeder.seed_records(3, 0, owner_ids=[admin.id])
+
+    runner = base_app.test_cli_runner()
+    result = runner.invoke(
+        utilities,
+        ["records", "list", "--jobs", "2", "--as-user", admin.email],
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0, result.output
+
+    service = get_record_service()
+    for model in service.record_cls.model_cls.query:
+        title = model.json["metadata"]["title"]
+        assert "{} - {}".format(model.json["id"], title) in result.output
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Tests for the generator of synthetic repository contents."""
+
+from invenio_app.factory import create_api
+from invenio_files_rest.models import Location
+from invenio_pidstore.models import PersistentIdentifier
+
+from invenio_utilities_tuw.cli.seed import RepositorySeeder
+from invenio_utilities_tuw.utils import get_record_service
+
+create_app = create_api
+"""Create the full InvenioRDM (API) application."""
+
+
+def test_seeded_records_refer_to_their_pids(database, admin):
+    """Test that the seeded records and drafts resolve to their own PIDs."""
+    seeder = RepositorySeeder(Location.get_default(), batch_size=2, seed=1)
+    seeder.seed_records(3, 2, owner_ids=[admin.id], edit_ratio=1)
+
+    service = get_record_service()
+    for api_cls in (service.record_cls, service.draft_cls):
+        for model in api_cls.model_cls.query:
+            record = api_cls(model.json, model=model)
+            pid = PersistentIdentifier.get("recid", record["id"])
+            assert record.pid.id == pid.id
+            assert pid.object_uuid == model.id
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Tests for the partitioning of bulk operations into shards."""
+
+import os
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, literal
+from sqlalchemy.orm import Session
+
+from invenio_utilities_tuw.cli.queries import shard_filter
+from invenio_utilities_tuw.cli.utils import in_shard
+
+UUIDS = [uuid.UUID(int=(i * 7919) ** 3 % 2**128, version=4) for i in range(200)]
+
+
+def test_in_shard_partitions_uuids():
+    """Test that each UUID belongs to exactly one shard."""
+    for value in UUIDS:
+        shards = [i for i in range(5) if in_shard(value, (i, 5))]
+        assert len(shards) == 1
+
+
+@pytest.fixture()
+def pg_session():
+    """Session for the PostgreSQL database of the tests."""
+    uri = os.environ.get("SQLALCHEMY_DATABASE_URI", "")
+    if not uri.startswith("postgresql"):
+        pytest.skip("requires PostgreSQL")
+
+    session = Session(create_engine(uri))
+    yield session
+    session.close()
+
+
+def test_shard_filter_agrees_with_in_shard(pg_session):
+    """Test that the SQL and the Python partitioning select the same UUIDs."""
+    for value in UUIDS:
+        for index in range(3):
+            condition = shard_filter(literal(str(value)), (index, 3))
+            assert pg_session.query(condition).scalar() == in_shard(value, (index, 3))
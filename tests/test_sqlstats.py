@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Tests for the SQL statement statistics."""
+
+from sqlalchemy import create_engine, text
+
+from invenio_utilities_tuw.cli.sqlstats import SQLStats, normalize_sql
+
+
+def test_normalize_sql():
+    """Test that literals, parameters and parameter lists are normalized."""
+    statement = "SELECT a FROM b WHERE id IN (%(id_1)s, %(id_2)s) AND c = 'x' LIMIT 10"
+    assert (
+        normalize_sql(statement) == "SELECT a FROM b WHERE id IN (?) AND c = ? LIMIT ?"
+    )
+
+
+def test_repeated_patterns():
+    """Test that statements issued once per row are flagged."""
+    engine = create_engine("sqlite://")
+    with SQLStats(repeat_threshold=3) as stats:
+        with engine.connect() as conn:
+            for i in range(3):
+                conn.execute(text("SELECT :i"), {"i": i})
+
+    assert stats.num_statements == 3
+    assert [count for _, count, _ in stats.repeated_patterns] == [3]
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Tests for the throttling of bulk operations."""
+
+import time
+
+import click
+from click.testing import CliRunner
+
+from invenio_utilities_tuw.cli.options import option_max_rate
+from invenio_utilities_tuw.cli.throttle import RateLimiter, Throttle
+from invenio_utilities_tuw.cli.workers import WorkerPool
+
+
+def test_rate_limiter():
+    """Test that the burst is free, and further units are delayed."""
+    limiter = RateLimiter(rate=100, burst=5)
+    start = time.monotonic()
+    limiter.acquire(5)
+    assert time.monotonic() - start < 0.02
+
+    limiter.acquire(5)
+    assert time.monotonic() - start >= 0.04
+
+
+def test_rate_limiter_without_rate():
+    """Test that a limiter without rate never waits."""
+    limiter = RateLimiter()
+    start = time.monotonic()
+    limiter.acquire(10**9)
+    assert time.monotonic() - start < 0.01
+
+
+def test_throttle_backs_off():
+    """Test that the delay grows with high latency, and shrinks again."""
+    latencies = [0.5, 0.5, 0]
+    throttle = Throttle(
+        max_latency=0.1, probe_interval=0, probes=[lambda: latencies.pop(0)]
+    )
+    throttle._probe()
+    assert throttle.delay == 0.5
+    throttle._probe()
+    assert throttle.delay == 1
+    throttle._probe()
+    assert throttle.delay == 0.5
+
+
+def test_failing_probe_is_captured(base_app, counting_session):
+    """Test that a failing probe fails the item, rather than the whole operation."""
+
+    def probe():
+        raise ConnectionError("search cluster unavailable")
+
+    throttle = Throttle(max_latency=1, probes=[probe])
+    with base_app.app_context():
+        results = list(WorkerPool(throttle=throttle).map(str, [1]))
+
+    assert isinstance(results[0].error, ConnectionError)
+    assert counting_session.rollbacks == 1
+
+
+def test_max_rate_must_be_positive():
+    """Test that a zero rate is rejected, rather than disabling the limit."""
+
+    @click.command()
+    @option_max_rate
+    def command(max_rate):
+        click.echo(max_rate)
+
+    result = CliRunner().invoke(command, ["--max-rate", "0"])
+    assert result.exit_code == 2
+    assert CliRunner().invoke(command, ["--max-rate", "0.5"]).output == "0.5\n"
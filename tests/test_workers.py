@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020-2021 TU Wien.
+#
+# Invenio-Utilities-TUW is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see LICENSE file for more
+# details.
+
+"""Tests for the worker pool."""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from invenio_utilities_tuw.cli.workers import WorkerPool, map_ordered
+
+
+def test_map_ordered_keeps_order():
+    """Test that the results are yielded in the order of the items."""
+
+    def slow_square(n):
+        time.sleep(0.01 * (5 - n % 5))
+        return n * n
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(map_ordered(executor, slow_square, range(20), window=8))
+
+    assert results == [n * n for n in range(20)]
+
+
+def test_map_ordered_is_lazy():
+    """Test that at most ``window`` items are consumed ahead of the results."""
+    consumed = []
+
+    def items():
+        for n in range(100):
+            consumed.append(n)
+            yield n
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = map_ordered(executor, lambda n: n, items(), window=3)
+        assert next(results) == 0
+        assert len(consumed) == 3
+        results.close()
+
+
+def test_worker_pool_captures_errors(base_app, counting_session):
+    """Test that errors are captured per item, without aborting the others."""
+
+    def invert(n):
+        return 1 / n
+
+    with base_app.app_context():
+        pool = WorkerPool(jobs=2)
+        results = list(pool.map(invert, [1, 0, 2]))
+
+    assert [r.item for r in results] == [1, 0, 2]
+    assert [r.value for r in results] == [1, None, 0.5]
+    assert isinstance(results[1].error, ZeroDivisionError)
+    assert (counting_session.commits, counting_session.rollbacks) == (2, 1)
+    assert (pool.summary.num_items, pool.summary.num_errors) == (3, 1)